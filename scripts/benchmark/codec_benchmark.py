@@ -0,0 +1,93 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import argparse
+import os
+import sys
+import time
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nex_databases"))
+
+from image_codec import encode, format_supported, make_codec  # noqa: E402
+
+default_options = [
+    ("PNG", 0), ("PNG", 1), ("PNG", 6), ("PNG", 9),
+    ("WebP (lossless)", 0),
+    ("WebP", 75), ("WebP", 90),
+    ("JPEG", 75), ("JPEG", 90),
+    ("AVIF", 60), ("AVIF", 80),
+    ("Raw", 0),
+]
+
+sample_infotext = (
+    "a photograph of an astronaut riding a horse\n"
+    "Negative prompt: blurry\n"
+    "Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: 1234, Size: 512x512, Model hash: 0123456789"
+)
+
+
+def synthetic_image(size):
+    fractal = Image.effect_mandelbrot((size, size), (-2.0, -1.5, 1.0, 1.5), 100)
+    noise = Image.effect_noise((size, size), 32)
+    gradient = Image.linear_gradient("L").resize((size, size))
+    return Image.merge("RGB", (fractal, noise, gradient))
+
+
+def benchmark(images, codec_format, level, repeat):
+    codec = make_codec(codec_format, png_compress_level=level, quality=level)
+    sizes = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for image in images:
+            sizes.append(len(encode(image, codec, sample_infotext)))
+    elapsed = time.perf_counter() - started
+    return elapsed / len(sizes), sum(sizes) / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode time and size per image for every Nex databases image format.")
+    parser.add_argument("inputs", nargs="*", help="images to encode, a synthetic image is used when omitted")
+    parser.add_argument("--size", type=int, default=1024, help="width and height of the synthetic image")
+    parser.add_argument("--repeat", type=int, default=3, help="times every image is encoded per option")
+    parser.add_argument("--link-mbps", type=float, default=100.0, help="link speed used to estimate transfer time")
+    args = parser.parse_args()
+
+    images = [Image.open(path).convert("RGB") for path in args.inputs] or [synthetic_image(args.size)]
+
+    print(f"{'format':<18}{'level':>6}{'encode ms':>12}{'KiB':>12}{'transfer ms':>14}{'total ms':>12}")
+    for codec_format, level in [option for option in default_options if format_supported(option[0])]:
+        try:
+            seconds, size = benchmark(images, codec_format, level, args.repeat)
+        except Exception as e:
+            print(f"{codec_format:<18}{level:>6}  unavailable: {e}")
+            continue
+        transfer = size * 8 / (args.link_mbps * 1000 * 1000)
+        print(f"{codec_format:<18}{level:>6}{seconds * 1000:>12.1f}{size / 1024:>12.1f}{transfer * 1000:>14.1f}{(seconds + transfer) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+from email.parser import BytesParser
+from email.policy import HTTP
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+
+class IPFSStubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def respond(self, body, content_type="application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+
+        if url.path == "/api/v0/version":
+            self.respond(json.dumps({"Version": "0.7.0"}).encode())
+        elif url.path == "/api/v0/add":
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            entries = []
+            for part in message.iter_parts():
+                data = part.get_payload(decode=True) or b""
+                content_hash = "Qm" + hashlib.sha256(data).hexdigest()[:44]
+                self.server.objects[content_hash] = data
+                entries.append(json.dumps({"Name": part.get_filename() or content_hash, "Hash": content_hash, "Size": str(len(data))}))
+            self.respond(("\n".join(entries) + "\n").encode())
+        elif url.path == "/api/v0/cat":
+            content_hash = parse_qs(url.query).get("arg", [""])[0]
+            self.respond(self.server.objects.get(content_hash, b""), "text/plain")
+        else:
+            self.send_error(404)
+
+
+class IPFSStubServer:
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), IPFSStubHandler)
+        self.server.objects = {}
+        self.thread = threading.Thread(target=self.server.serve_forever, name="ipfs-stub", daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"/ip4/{host}/tcp/{port}/http"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
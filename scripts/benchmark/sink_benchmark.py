@@ -0,0 +1,236 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from PIL import Image
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmark_dir)
+sys.path.insert(1, os.path.dirname(benchmark_dir))
+
+import webui_stubs  # noqa: E402
+from ipfs_stub import IPFSStubServer  # noqa: E402
+
+sink_keys = {
+    "sqlite": "sqlite",
+    "mongodb": "mongodb",
+    "postgres": "postgre",
+    "mysql": "mysql",
+    "neo4j": "neo4j",
+}
+
+samplers = ["Euler a", "DPM++ 2M Karras", "DDIM", "UniPC"]
+
+
+def synthetic_images(count, size):
+    gradient = Image.linear_gradient("L").resize((size, size))
+    images = []
+    for _ in range(count):
+        noise = Image.effect_noise((size, size), random.randint(8, 64))
+        fractal = Image.effect_mandelbrot((size, size), (-2.0, -1.5, 1.0, 1.5), random.randint(20, 100))
+        images.append(Image.merge("RGB", (fractal, noise, gradient)))
+    return images
+
+
+def synthetic_processed(count, size, batch_number):
+    prompt = f"a photograph of an astronaut riding a horse, benchmark batch {batch_number}"
+    infotexts = [
+        f"{prompt}\n"
+        f"Negative prompt: blurry, lowres\n"
+        f"Steps: {random.randint(10, 50)}, Sampler: {random.choice(samplers)}, CFG scale: {random.choice([5, 7, 7.5, 9])}, "
+        f"Seed: {random.randint(0, 2 ** 32 - 1)}, Size: {size}x{size}, Model hash: {random.getrandbits(40):010x}"
+        for _ in range(count)
+    ]
+    return SimpleNamespace(images=synthetic_images(count, size), infotexts=infotexts, prompt=prompt)
+
+
+def sink_options(sink, key, args, workdir):
+    options = {
+        f'nex_databases_enable_{key}': True,
+        f'nex_databases_codec_{key}': args.codec,
+        'nex_databases_enable_spool': False,
+    }
+    table = {
+        f'nex_databases_table_{key}': "nex_benchmark_images",
+        f'nex_databases_metadata_{key}': "metadata",
+        f'nex_databases_bytes_{key}': "image",
+    }
+
+    if sink == "sqlite":
+        options.update(table)
+        options[f'nex_databases_connection_string_{key}'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    elif sink in ("postgres", "mysql"):
+        options.update(table)
+        options[f'nex_databases_connection_string_{key}'] = getattr(args, f"{sink}_url")
+    elif sink == "mongodb":
+        options['nex_databases_connection_string_mongodb'] = args.mongodb_url or "mongodb://localhost:27017/"
+        options['nex_databases_database_name_mongodb'] = "nex_benchmark"
+        options['nex_databases_collection_name_mongodb'] = "images"
+    elif sink == "neo4j":
+        options['nex_databases_connection_string_neo4j'] = args.neo4j_url
+        options['nex_databases_user_name_neo4j'] = args.neo4j_user
+        options['nex_databases_password_neo4j'] = args.neo4j_password
+
+    for option in args.option:
+        name, _, value = option.partition("=")
+        options[name] = value
+    return options
+
+
+def run_sink(sink, args):
+    key = sink_keys[sink]
+    workdir = tempfile.mkdtemp(prefix="nex-benchmark-")
+    options = sink_options(sink, key, args, workdir)
+    webui_stubs.install(options)
+
+    ipfs = None
+    if sink == "neo4j" and not args.ipfs_address:
+        ipfs = IPFSStubServer().start()
+        options['nex_databases_ipfs_address_neo4j'] = ipfs.address
+    elif sink == "neo4j":
+        options['nex_databases_ipfs_address_neo4j'] = args.ipfs_address
+
+    if sink == "mongodb" and not args.mongodb_url:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    started = time.perf_counter()
+    import nex_databases
+    import_seconds = time.perf_counter() - started
+
+    database = next(database for database in nex_databases.databases if database.key == key)
+    database.load()
+    codec = database.codec()
+
+    images = 0
+    encode_seconds = 0.0
+    write_seconds = 0.0
+    for batch_number in range(args.batches):
+        processed = synthetic_processed(args.batch_size, args.size, batch_number)
+
+        started = time.perf_counter()
+        prepared = nex_databases.record_preparer.prepare(processed, {codec})[codec]
+        encoded = time.perf_counter()
+        database.insert(prepared)
+        written = time.perf_counter()
+
+        images += len(prepared)
+        encode_seconds += encoded - started
+        write_seconds += written - encoded
+
+    nex_databases.writer.shutdown()
+    if ipfs:
+        ipfs.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "sink": sink,
+        "images": images,
+        "import_seconds": import_seconds,
+        "load_seconds": database.load_seconds,
+        "encode_seconds": encode_seconds,
+        "write_seconds": write_seconds,
+        "peak_rss_megabytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_in_subprocess(sink, argv):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--sink", sink] + argv,
+        capture_output=True, text=True
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+        return {"sink": sink, "error": error}
+    return json.loads(lines[-1])
+
+
+def report(results):
+    print(
+        f"{'sink':<10}{'images':>8}{'images/s':>10}{'encode ms/img':>15}{'write ms/img':>14}{'write share':>13}"
+        f"{'import ms':>11}{'load ms':>9}{'peak RSS MB':>13}"
+    )
+    for result in results:
+        if "error" in result:
+            print(f"{result['sink']:<10}  failed: {result['error']}")
+            continue
+        images = max(result["images"], 1)
+        total = result["encode_seconds"] + result["write_seconds"]
+        print(
+            f"{result['sink']:<10}{result['images']:>8}{result['images'] / max(total, 1e-9):>10.1f}"
+            f"{result['encode_seconds'] * 1000 / images:>15.1f}{result['write_seconds'] * 1000 / images:>14.1f}"
+            f"{result['write_seconds'] / max(total, 1e-9):>13.0%}{result['import_seconds'] * 1000:>11.0f}"
+            f"{result['load_seconds'] * 1000:>9.0f}{result['peak_rss_megabytes']:>13.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Images/s, encode and write time, import and load time and peak RSS per Nex databases sink, without the webui.")
+    parser.add_argument("--sinks", default="sqlite,mongodb", help=f"comma separated sinks out of {', '.join(sink_keys)}")
+    parser.add_argument("--batches", type=int, default=10, help="number of synthetic batches written per sink")
+    parser.add_argument("--batch-size", type=int, default=4, help="images per batch")
+    parser.add_argument("--size", type=int, default=512, help="width and height of the synthetic images")
+    parser.add_argument("--codec", default="PNG", help="image format stored by every sink")
+    parser.add_argument("--mongodb-url", default="", help="MongoDB connection string, mongomock is used when omitted")
+    parser.add_argument("--postgres-url", default="", help="SQLAlchemy connection string of a PostgreSQL database")
+    parser.add_argument("--mysql-url", default="", help="SQLAlchemy connection string of a MySQL database")
+    parser.add_argument("--neo4j-url", default="", help="bolt URL of a Neo4j database")
+    parser.add_argument("--neo4j-user", default="neo4j")
+    parser.add_argument("--neo4j-password", default="")
+    parser.add_argument("--ipfs-address", default="", help="IPFS API address, a local IPFS stub is used when omitted")
+    parser.add_argument("--option", action="append", default=[], help="extra setting as name=value, e.g. nex_databases_thumbnail_sizes=256")
+    parser.add_argument("--sink", help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+
+    if args.sink:
+        print(json.dumps(run_sink(args.sink, args)))
+        return
+
+    sinks = [sink.strip() for sink in args.sinks.split(",") if sink.strip()]
+    unknown = [sink for sink in sinks if sink not in sink_keys]
+    if unknown:
+        parser.error(f"unknown sinks: {', '.join(unknown)}")
+    for sink in ("postgres", "mysql", "neo4j"):
+        if sink in sinks and not getattr(args, f"{sink}_url"):
+            parser.error(f"--{sink}-url is needed to benchmark {sink}")
+
+    report([run_in_subprocess(sink, sys.argv[1:]) for sink in sinks])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import json
+import re
+import sys
+import types
+
+re_param = re.compile(r'\s*(\w[\w \-/]+):\s*("(?:\\.|[^\\"])+"|[^,]*)(?:,|$)')
+re_imagesize = re.compile(r"^(\d+)x(\d+)$")
+
+
+class OptionInfo:
+
+    def __init__(self, default=None, label="", component=None, component_args=None, onchange=None, section=None, refresh=None, **kwargs):
+        self.default = default
+        self.label = label
+        self.component = component
+        self.component_args = component_args
+        self.onchange = onchange
+        self.section = section
+        self.refresh = refresh
+        self.do_not_save = False
+
+
+def options_section(section, options):
+    for option in options.values():
+        option.section = section
+    return options
+
+
+def coerce(value, default):
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, (int, float)):
+        return type(default)(float(value)) if isinstance(default, int) else float(value)
+    return value
+
+
+class Options:
+
+    def __init__(self, templates, values):
+        self.__dict__['templates'] = templates
+        self.__dict__['values'] = values
+
+    def __getattr__(self, name):
+        template = self.templates.get(name)
+        if name in self.values:
+            value = self.values[name]
+            if isinstance(value, str) and template is not None and not isinstance(template.default, str):
+                return coerce(value, template.default)
+            return value
+        if template is not None:
+            return template.default
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.values[name] = value
+
+
+def parse_generation_parameters(infotext):
+    result = {}
+    prompt = ""
+    negative_prompt = ""
+    done_with_prompt = False
+
+    *lines, last_line = infotext.strip().split("\n")
+    if len(re_param.findall(last_line)) < 3:
+        lines.append(last_line)
+        last_line = ""
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Negative prompt:"):
+            done_with_prompt = True
+            line = line[16:].strip()
+        if done_with_prompt:
+            negative_prompt += ("" if negative_prompt == "" else "\n") + line
+        else:
+            prompt += ("" if prompt == "" else "\n") + line
+
+    result["Prompt"] = prompt
+    result["Negative prompt"] = negative_prompt
+
+    for key, value in re_param.findall(last_line):
+        if value[:1] == '"' and value[-1:] == '"':
+            value = json.loads(value)
+        size = re_imagesize.match(value)
+        if size is not None:
+            result[f"{key}-1"] = size.group(1)
+            result[f"{key}-2"] = size.group(2)
+        else:
+            result[key] = value
+
+    return result
+
+
+class Component:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def module(name, **attributes):
+    created = types.ModuleType(name)
+    created.__dict__.update(attributes)
+    sys.modules[name] = created
+    return created
+
+
+def install(values=None, parser=None):
+    options_templates = {}
+    shared = module(
+        "modules.shared",
+        options_templates=options_templates,
+        OptionInfo=OptionInfo,
+        options_section=options_section,
+        opts=Options(options_templates, values if values is not None else {}),
+    )
+    scripts = module("modules.scripts", Script=object, AlwaysVisible=object(), PostprocessImageArgs=types.SimpleNamespace)
+    copypaste = module("modules.generation_parameters_copypaste", parse_generation_parameters=parser or parse_generation_parameters)
+    module("modules", __path__=[], shared=shared, scripts=scripts, generation_parameters_copypaste=copypaste)
+
+    try:
+        import gradio  # noqa: F401
+    except ImportError:
+        module(
+            "gradio",
+            __getattr__=lambda name: Component,
+            Info=lambda message: None,
+            Warning=lambda message: None,
+        )
+
+    return shared
@@ -25,20 +25,57 @@ SOFTWARE.
 """
 
 import modules.scripts as scripts
-from scripts.nex_databases import databases
+from modules import processing
+from modules import script_callbacks
+from scripts.nex_databases import browser, stage_metrics, writer
 
 
 class DatabaseManagerNex(scripts.Script):
 
+    pending_images = None
+    pending_infotexts = None
+
     def title(self):
         return "Database Manager Nex"
 
     def show(self, is_img2img):
         return scripts.AlwaysVisible
 
+    def process(self, p, *args):
+        self.pending_images = []
+        self.pending_infotexts = []
+
+    def before_process_batch(self, p, *args, **kwargs):
+        self.flush(p)
+
+    def postprocess_image(self, p, pp, *args):
+        if not writer.streaming() or self.pending_images is None:
+            return
+
+        infotext = processing.create_infotext(
+            p, p.all_prompts, p.all_seeds, p.all_subseeds,
+            comments=[], iteration=p.iteration, position_in_batch=len(self.pending_images)
+        )
+        self.pending_images.append(pp.image)
+        self.pending_infotexts.append(infotext)
+
     def postprocess(self, p, processed, *args):
-        for database in databases:
-            try:
-                database.insert(processed)
-            except Exception as e:
-                print(f"Error after post processing: {str(e)}")
+        if writer.streaming():
+            self.flush(p)
+            return
+
+        writer.put(processed)
+
+    def flush(self, p):
+        if not self.pending_images:
+            return
+
+        prompt = p.prompt if not isinstance(p.prompt, list) else p.prompt[0]
+        writer.put_images(self.pending_images, self.pending_infotexts, prompt)
+        self.pending_images = []
+        self.pending_infotexts = []
+
+
+script_callbacks.on_script_unloaded(writer.shutdown)
+script_callbacks.on_ui_tabs(browser.on_ui_tabs)
+script_callbacks.on_app_started(stage_metrics.on_app_started)
@@ -1,19 +1,32 @@
-from .mongodb_database import MongoDBDatabase
-from .sqlite_database import SQLiteDatabase
-from .neo4j_database import Neo4jDatabase
-from .mysql_database import MySQLDatabase
-from .postgres_database import PostgresDatabase
+from .browse_tab import BrowseTab
+from .circuit_breaker import register_circuit_breaker_options
+from .connection_pool import register_pool_options, warm_up_in_background
+from .database_options import mongodb_options, mysql_options, neo4j_options, postgres_options, sqlite_options
+from .fan_out import DatabaseFanOut
+from .lazy_database import LazyDatabase
+from .metrics import stage_metrics
+from .prepared_record import RecordPreparer
+from .spool import Spool
+from .write_queue import WriteQueue
 
 
-all_database_classes = [
-    MongoDBDatabase,
-    MySQLDatabase,
-    Neo4jDatabase,
-    PostgresDatabase,
-    SQLiteDatabase,
+# each backend module, with its driver, is imported the first time the database is used
+databases = [
+    LazyDatabase("MongoDB", "mongodb", ".mongodb_database", "MongoDBDatabase", mongodb_options),
+    LazyDatabase("MySQL", "mysql", ".mysql_database", "MySQLDatabase", mysql_options),
+    LazyDatabase("Neo4j", "neo4j", ".neo4j_database", "Neo4jDatabase", neo4j_options),
+    LazyDatabase("PostgreSQL", "postgre", ".postgres_database", "PostgresDatabase", postgres_options),
+    LazyDatabase("SQLite", "sqlite", ".sqlite_database", "SQLiteDatabase", sqlite_options),
 ]
 
-# initialise_database_names
-databases = []
-for database in all_database_classes:
-    databases.append(database())
+register_pool_options()
+register_circuit_breaker_options()
+
+record_preparer = RecordPreparer()
+distributor = DatabaseFanOut()
+spooler = Spool(databases, distributor)
+writer = WriteQueue(databases, record_preparer, distributor, spooler)
+browser = BrowseTab(databases)
+
+warm_up_in_background(databases)
+spooler.resume()
@@ -0,0 +1,250 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+from modules import shared
+from .connection_pool import PooledConnection
+from .metrics import stage_metrics
+from .setting_button import OptionButton
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+default_blob_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "blobs")
+blob_store_kinds = ["None", "Local Directory", "S3"]
+missing_object_codes = ["404", "NoSuchKey", "NotFound"]
+
+
+def blob_references(database):
+    try:
+        return database.blob_references
+    except Exception as e:
+        logger.error(f"Error loading {database.name}, its images are not written to the blob store: {e}")
+        return False
+
+
+def blob_key(record):
+    return f"{record.image_hash[:2]}/{record.image_hash[2:4]}/{record.image_hash}.{record.extension}"
+
+
+class LocalBlobStore:
+
+    def __init__(self, path):
+        self.path = path or default_blob_path
+
+    def file(self, key):
+        return os.path.join(self.path, *key.split("/"))
+
+    def put(self, key, data, content_type):
+        path = self.file(key)
+        if os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        return True
+
+    def read(self, key, chunk_size):
+        with open(self.file(key), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def test(self):
+        os.makedirs(self.path, exist_ok=True)
+        if not os.access(self.path, os.W_OK):
+            raise PermissionError(f"{self.path} is not writable")
+        return self.path
+
+    def close(self):
+        pass
+
+
+class S3BlobStore:
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region, prefix):
+        import boto3
+
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            region_name=region or None,
+        )
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data, content_type):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return False
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in missing_object_codes:
+                raise
+
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data, ContentType=content_type)
+        return True
+
+    def read(self, key, chunk_size):
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def test(self):
+        self.client.head_bucket(Bucket=self.bucket)
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def close(self):
+        self.client.close()
+
+
+class BlobStore:
+
+    name = "Blob Store"
+
+    def __init__(self):
+        self.pool = PooledConnection(self.name, self.create_store, lambda store: store.close())
+        self.executor = None
+        self.lock = threading.Lock()
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_kind_blob_store': shared.OptionInfo(
+                        "None", 'Store Images Outside The Databases - Blob Store', gr.Radio,
+                        {'choices': blob_store_kinds}
+                    ),
+                    f'nex_databases_path_blob_store': shared.OptionInfo(
+                        "", 'Directory (Local Directory) - Blob Store', gr.Textbox,
+                        {'placeholder': default_blob_path}
+                    ),
+                    f'nex_databases_endpoint_blob_store': shared.OptionInfo(
+                        "", 'Endpoint URL, Empty For AWS (S3) - Blob Store', gr.Textbox,
+                        {'placeholder': 'http://localhost:9000'}
+                    ),
+                    f'nex_databases_bucket_blob_store': shared.OptionInfo("", 'Bucket (S3) - Blob Store'),
+                    f'nex_databases_prefix_blob_store': shared.OptionInfo("", 'Key Prefix (S3) - Blob Store'),
+                    f'nex_databases_region_blob_store': shared.OptionInfo("", 'Region (S3) - Blob Store'),
+                    f'nex_databases_access_key_blob_store': shared.OptionInfo("", 'Access Key (S3) - Blob Store'),
+                    f'nex_databases_secret_key_blob_store': shared.OptionInfo("", 'Secret Key (S3) - Blob Store'),
+                    f'nex_databases_test_button_blob_store': OptionButton('Test - Blob Store!', self.test_connectivity),
+                }
+            )
+        )
+
+    def enabled(self):
+        return shared.opts.nex_databases_kind_blob_store != "None"
+
+    def settings(self):
+        return (
+            shared.opts.nex_databases_kind_blob_store,
+            shared.opts.nex_databases_path_blob_store,
+            shared.opts.nex_databases_endpoint_blob_store,
+            shared.opts.nex_databases_bucket_blob_store,
+            shared.opts.nex_databases_access_key_blob_store,
+            shared.opts.nex_databases_secret_key_blob_store,
+            shared.opts.nex_databases_region_blob_store,
+            shared.opts.nex_databases_prefix_blob_store,
+        )
+
+    def create_store(self):
+        kind, path, endpoint, bucket, access_key, secret_key, region, prefix = self.settings()
+        if kind == "Local Directory":
+            return LocalBlobStore(path)
+        if kind == "S3":
+            return S3BlobStore(endpoint, bucket, access_key, secret_key, region, prefix)
+        raise ValueError(f"Unknown blob store: {kind}")
+
+    def store(self):
+        return self.pool.get(self.settings())
+
+    def pool_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="nex-databases-blob-store")
+            return self.executor
+
+    def put_records(self, records):
+        unique = {}
+        for record in records:
+            unique.setdefault(blob_key(record), record)
+
+        store = self.store()
+        written = list(self.pool_executor().map(
+            lambda item: store.put(item[0], item[1].image_bytes, item[1].content_type),
+            unique.items()
+        ))
+
+        for record in records:
+            record.blob_key = blob_key(record)
+            record.blob_size = len(record.image_bytes)
+
+        stage_metrics.record_write(
+            self.name, sum(written),
+            sum(len(record.image_bytes) for record, stored in zip(unique.values(), written) if stored)
+        )
+        logger.info(f"Stored {sum(written)} of {len(unique)} images in the {self.name}")
+        return sum(written)
+
+    def read(self, key, chunk_size=1024 * 1024):
+        return self.store().read(key, chunk_size)
+
+    def test_connectivity(self):
+        try:
+            location = self.store().test()
+            message = f"Connected successfully to the {self.name} at {location}!"
+            gr.Info(message)
+        except Exception as e:
+            message = f"Error connecting to the {self.name}: {str(e)}"
+            gr.Warning(message)
+        return message
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        self.pool.dispose()
+
+
+blob_store = BlobStore()
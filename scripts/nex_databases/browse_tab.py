@@ -0,0 +1,176 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+from PIL import Image
+from modules import shared
+from .image_codec import decode
+from .search import empty_query, make_query
+
+result_headers = ["Prompt", "Seed", "Steps", "Sampler", "Model hash", "Size", "Created (UTC)", "Image hash"]
+empty_row = [""] * len(result_headers)
+missing_thumbnail = Image.new("RGB", (64, 64), (128, 128, 128))
+
+
+def result_row(result):
+    metadata = result.metadata
+    size = f"{metadata['Size-1']}x{metadata['Size-2']}" if "Size-1" in metadata and "Size-2" in metadata else ""
+    return [
+        str(metadata.get("Prompt", ""))[:300],
+        metadata.get("Seed", ""),
+        metadata.get("Steps", ""),
+        metadata.get("Sampler", ""),
+        metadata.get("Model hash", ""),
+        size,
+        result.created_at.strftime("%Y-%m-%d %H:%M") if result.created_at else "",
+        result.image_hash or "",
+    ]
+
+
+def image_size(metadata):
+    try:
+        return int(metadata["Size-1"]), int(metadata["Size-2"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def gallery_item(result):
+    try:
+        image = decode(result.thumbnail) if result.thumbnail else missing_thumbnail
+    except Exception:
+        image = missing_thumbnail
+    return image, f"Seed {result.metadata.get('Seed', '')}"
+
+
+class BrowseTab:
+
+    def __init__(self, databases):
+        self.databases = databases
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_page_size_browse': shared.OptionInfo(
+                        50, 'Results Per Page - Browse Tab', gr.Slider,
+                        {'minimum': 10, 'maximum': 500, 'step': 10}
+                    ),
+                }
+            )
+        )
+
+    def database(self, name):
+        for database in self.databases:
+            if database.name == name:
+                return database
+        raise ValueError(f"Unknown database: {name}")
+
+    def page(self, name, query, cursors):
+        try:
+            results, next_cursor = self.database(name).search(
+                query or empty_query, cursors[-1], int(shared.opts.nex_databases_page_size_browse)
+            )
+        except Exception as e:
+            gr.Warning(f"Error searching {name}: {str(e)}")
+            results, next_cursor = [], None
+
+        grid = [result_row(result) for result in results] or [empty_row]
+        gallery = [gallery_item(result) for result in results]
+        more = " (more on the next page)" if next_cursor is not None else ""
+        return cursors, results, next_cursor, grid, gallery, f"Page {len(cursors)}: {len(results)} images{more}"
+
+    def search(self, name, prompt, seed, model_hash, date_from, date_to):
+        try:
+            query = make_query(prompt, seed, model_hash, date_from, date_to)
+        except ValueError as e:
+            gr.Warning(str(e))
+            return (None,) + self.clear()[1:]
+        return (query,) + self.page(name, query, [None])
+
+    def next_page(self, name, query, cursors, next_cursor):
+        if next_cursor is None:
+            gr.Info("There are no more results")
+            return self.page(name, query, cursors)
+        return self.page(name, query, cursors + [next_cursor])
+
+    def previous_page(self, name, query, cursors):
+        return self.page(name, query, cursors[:-1] or [None])
+
+    def clear(self):
+        return None, [None], [], None, [empty_row], [], ""
+
+    def show_image(self, name, results, evt: gr.SelectData):
+        row = evt.index[0] if isinstance(evt.index, (list, tuple)) else evt.index
+        if row >= len(results):
+            return None, None
+
+        result = results[row]
+        try:
+            image_bytes = b"".join(self.database(name).read_image(result.key))
+            image = decode(image_bytes, image_size(result.metadata)) if image_bytes else None
+        except Exception as e:
+            gr.Warning(f"Error reading the image from {name}: {str(e)}")
+            image = None
+        return image, result.metadata
+
+    def on_ui_tabs(self):
+        names = [database.name for database in self.databases]
+        enabled = [database.name for database in self.databases if database.enabled()]
+
+        with gr.Blocks(analytics_enabled=False) as tab:
+            with gr.Row():
+                database = gr.Dropdown(label="Database", choices=names, value=(enabled or names)[0])
+                prompt = gr.Textbox(label="Prompt Contains")
+                seed = gr.Textbox(label="Seed")
+                model_hash = gr.Textbox(label="Model Hash")
+                date_from = gr.Textbox(label="From (UTC)", placeholder="YYYY-MM-DD")
+                date_to = gr.Textbox(label="To (UTC)", placeholder="YYYY-MM-DD")
+            with gr.Row():
+                search = gr.Button("Search", variant="primary")
+                previous_page = gr.Button("Previous Page")
+                next_page = gr.Button("Next Page")
+                page = gr.Markdown()
+            with gr.Row():
+                with gr.Column(scale=2):
+                    gallery = gr.Gallery(label="Thumbnails", columns=8, allow_preview=False)
+                    grid = gr.Dataframe(headers=result_headers, interactive=False, wrap=True)
+                with gr.Column(scale=1):
+                    image = gr.Image(label="Image", type="pil", interactive=False)
+                    metadata = gr.JSON(label="Metadata")
+
+            query = gr.State(None)
+            cursors = gr.State([None])
+            results = gr.State([])
+            next_cursor = gr.State(None)
+            page_outputs = [cursors, results, next_cursor, grid, gallery, page]
+
+            search.click(fn=self.search, inputs=[database, prompt, seed, model_hash, date_from, date_to], outputs=[query] + page_outputs)
+            next_page.click(fn=self.next_page, inputs=[database, query, cursors, next_cursor], outputs=page_outputs)
+            previous_page.click(fn=self.previous_page, inputs=[database, query, cursors], outputs=page_outputs)
+            database.change(fn=self.clear, outputs=[query] + page_outputs)
+            grid.select(fn=self.show_image, inputs=[database, results], outputs=[image, metadata])
+            gallery.select(fn=self.show_image, inputs=[database, results], outputs=[image, metadata])
+
+        return [(tab, "Nex Databases", "nex_databases_browse")]
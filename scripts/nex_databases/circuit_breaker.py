@@ -0,0 +1,121 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+import logging
+import random
+import threading
+import time
+from modules import shared
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def register_circuit_breaker_options():
+    shared.options_templates.update(
+        shared.options_section(
+            ('nex-databases', "Nex databases"), {
+                f'nex_databases_failure_threshold_circuit': shared.OptionInfo(
+                    3, 'Consecutive Failures Before Pausing A Database', gr.Slider,
+                    {'minimum': 1, 'maximum': 20, 'step': 1}
+                ),
+                f'nex_databases_base_backoff_circuit': shared.OptionInfo(
+                    5, 'First Pause Before Retrying A Failed Database (seconds)', gr.Slider,
+                    {'minimum': 1, 'maximum': 300, 'step': 1}
+                ),
+                f'nex_databases_max_backoff_circuit': shared.OptionInfo(
+                    300, 'Longest Pause Before Retrying A Failed Database (seconds)', gr.Slider,
+                    {'minimum': 1, 'maximum': 3600, 'step': 1}
+                ),
+            }
+        )
+    )
+
+
+class CircuitBreaker:
+
+    closed = "closed"
+    open = "open"
+    half_open = "half-open"
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.closed
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.closed:
+                return True
+            if self.state == self.open and time.monotonic() >= self.retry_at:
+                self.state = self.half_open
+                logger.info(f"{self.name} circuit is half-open, trying one write")
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.closed:
+                logger.info(f"{self.name} circuit is closed again")
+            self.state = self.closed
+            self.failures = 0
+            self.trips = 0
+            self.last_error = None
+
+    def record_failure(self, error=None):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error) if error else self.last_error
+            threshold = int(shared.opts.nex_databases_failure_threshold_circuit)
+            if self.state != self.half_open and self.failures < threshold:
+                return
+
+            self.trips += 1
+            base = float(shared.opts.nex_databases_base_backoff_circuit)
+            ceiling = float(shared.opts.nex_databases_max_backoff_circuit)
+            backoff = min(ceiling, base * 2 ** (self.trips - 1))
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+            self.state = self.open
+            self.retry_at = time.monotonic() + delay
+            logger.warning(f"{self.name} circuit is open after {self.failures} failures, retrying in {delay:.1f}s")
+
+    def status(self):
+        with self.lock:
+            if self.state == self.open:
+                message = f"Circuit {self.state}, retrying in {max(0.0, self.retry_at - time.monotonic()):.0f}s"
+            else:
+                message = f"Circuit {self.state}"
+            if self.failures:
+                message += f", {self.failures} consecutive failures"
+            if self.last_error:
+                message += f" (last error: {self.last_error})"
+            return message
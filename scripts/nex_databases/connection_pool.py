@@ -0,0 +1,112 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+import logging
+import threading
+from modules import shared
+from .metrics import stage_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def register_pool_options():
+    shared.options_templates.update(
+        shared.options_section(
+            ('nex-databases', "Nex databases"), {
+                f'nex_databases_pool_size': shared.OptionInfo(
+                    5, 'Connection Pool Size', gr.Slider,
+                    {'minimum': 1, 'maximum': 64, 'step': 1}
+                ),
+                f'nex_databases_pool_pre_ping': shared.OptionInfo(True, 'Pre-ping Pooled Connections'),
+                f'nex_databases_pool_recycle': shared.OptionInfo(
+                    3600, 'Recycle Pooled Connections After (seconds, 0 to disable)', gr.Slider,
+                    {'minimum': 0, 'maximum': 86400, 'step': 60}
+                ),
+            }
+        )
+    )
+
+
+def pool_settings():
+    return (
+        int(shared.opts.nex_databases_pool_size),
+        bool(shared.opts.nex_databases_pool_pre_ping),
+        int(shared.opts.nex_databases_pool_recycle),
+    )
+
+
+def warm_up(databases):
+    for database in databases:
+        if not database.enabled():
+            continue
+        try:
+            database.warm_up()
+            logger.info(f"Warmed up connection to {database.name}")
+        except Exception as e:
+            logger.warning(f"Error warming up connection to {database.name}: {e}")
+
+
+def warm_up_in_background(databases):
+    thread = threading.Thread(target=warm_up, args=(databases,), name="nex-databases-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+class PooledConnection:
+
+    def __init__(self, name, create, dispose):
+        self.name = name
+        self.create = create
+        self.dispose_resource = dispose
+        self.resource = None
+        self.settings = None
+        self.lock = threading.Lock()
+
+    def get(self, settings):
+        with self.lock:
+            if self.resource is None or self.settings != settings:
+                self.release()
+                with stage_metrics.measure(self.name, "engine"):
+                    self.resource = self.create()
+                self.settings = settings
+            return self.resource
+
+    def dispose(self):
+        with self.lock:
+            self.release()
+
+    def release(self):
+        if self.resource is None:
+            return
+        try:
+            self.dispose_resource(self.resource)
+        except Exception as e:
+            logger.error(f"Error closing the {self.name} connection: {e}")
+        finally:
+            self.resource = None
+            self.settings = None
@@ -0,0 +1,58 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import threading
+
+
+class DeduplicationStats:
+
+    name = "Deduplication"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.images = {}
+        self.duplicates = {}
+
+    def record(self, database_name, images, duplicates):
+        with self.lock:
+            self.images[database_name] = self.images.get(database_name, 0) + images
+            self.duplicates[database_name] = self.duplicates.get(database_name, 0) + duplicates
+
+    def hit_rates(self):
+        with self.lock:
+            return {
+                name: (self.duplicates[name], images, self.duplicates[name] / images if images else 0.0)
+                for name, images in self.images.items()
+            }
+
+    def summary(self):
+        return ", ".join(
+            f"{name} {duplicates}/{images} duplicates ({rate:.0%})"
+            for name, (duplicates, images, rate) in self.hit_rates().items()
+        )
+
+
+deduplication_stats = DeduplicationStats()
@@ -0,0 +1,152 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+import threading
+import time
+from modules import shared
+from .metrics import stage_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DatabaseFanOut:
+
+    name = "Fan Out"
+
+    def __init__(self):
+        self.executors = {}
+        self.outcomes = {}
+        self.backlogs = {}
+        self.lock = threading.Lock()
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_timeout_fan_out': shared.OptionInfo(
+                        30, 'Write Timeout Per Database (seconds)', gr.Slider,
+                        {'minimum': 1, 'maximum': 600, 'step': 1}
+                    ),
+                    f'nex_databases_backlog_fan_out': shared.OptionInfo(
+                        2, 'Max Batches Waiting Per Database (more go straight to the spool)', gr.Slider,
+                        {'minimum': 1, 'maximum': 64, 'step': 1}
+                    ),
+                }
+            )
+        )
+
+    def executor(self, database):
+        with self.lock:
+            executor = self.executors.get(database.name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"nex-databases-{database.name.lower()}")
+                self.executors[database.name] = executor
+            return executor
+
+    def reserve(self, database):
+        with self.lock:
+            backlog = self.backlogs.get(database.name, 0)
+            if backlog >= int(shared.opts.nex_databases_backlog_fan_out):
+                return False
+            self.backlogs[database.name] = backlog + 1
+            return True
+
+    def submit(self, database, batch):
+        future = self.executor(database).submit(self.insert, database, batch)
+        future.add_done_callback(lambda _: self.release(database))
+        return future
+
+    def release(self, database):
+        with self.lock:
+            self.backlogs[database.name] -= 1
+
+    def write(self, batches):
+        timeout = float(shared.opts.nex_databases_timeout_fan_out)
+        deadline = time.monotonic() + timeout
+
+        outcomes = {}
+        failed = []
+        futures = []
+        for database, batch in batches.items():
+            if not self.reserve(database):
+                stage_metrics.record_error(database.name, "backlog")
+                outcomes[database.name] = "skipped, earlier writes still waiting"
+                failed.append(database)
+                continue
+            if not database.circuit_breaker.allow():
+                self.release(database)
+                outcomes[database.name] = database.circuit_breaker.status()
+                failed.append(database)
+                continue
+            futures.append((database, self.submit(database, batch)))
+
+        for database, future in futures:
+            try:
+                elapsed = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                outcomes[database.name] = f"ok in {elapsed:.2f}s"
+            except FutureTimeoutError:
+                future.cancel()
+                database.circuit_breaker.record_failure(f"timed out after {timeout:.0f}s")
+                stage_metrics.record_error(database.name, "timeout")
+                outcomes[database.name] = f"timed out after {timeout:.0f}s"
+                failed.append(database)
+                print(f"Error after post processing: {database.name} timed out after {timeout:.0f}s")
+            except Exception as e:
+                outcomes[database.name] = f"failed: {str(e)}"
+                failed.append(database)
+                print(f"Error after post processing: {str(e)}")
+
+        images = max(len(batch) for batch in batches.values())
+        logger.info(f"Wrote {images} images: " + ", ".join(f"{name} {outcome}" for name, outcome in outcomes.items()))
+        with self.lock:
+            self.outcomes.update(outcomes)
+        return failed
+
+    @staticmethod
+    def insert(database, batch):
+        started = time.monotonic()
+        try:
+            with stage_metrics.measure(database.name, "total"):
+                database.insert(batch)
+        except Exception as e:
+            database.circuit_breaker.record_failure(e)
+            raise e
+        database.circuit_breaker.record_success()
+        return time.monotonic() - started
+
+    def last_outcomes(self):
+        with self.lock:
+            return dict(self.outcomes)
+
+    def shutdown(self):
+        with self.lock:
+            executors = self.executors
+            self.executors = {}
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+from collections import namedtuple
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError, features
+from PIL.PngImagePlugin import PngInfo
+
+ImageCodec = namedtuple("ImageCodec", ["format", "level"])
+
+format_features = {
+    "WebP (lossless)": "webp",
+    "WebP": "webp",
+    "AVIF": "avif",
+}
+
+
+def format_supported(codec_format):
+    feature = format_features.get(codec_format)
+    if feature is None:
+        return True
+    try:
+        return bool(features.check_module(feature))
+    except ValueError:
+        return False
+
+
+codec_formats = [codec_format for codec_format in ["PNG", "WebP (lossless)", "WebP", "JPEG", "AVIF", "Raw"] if format_supported(codec_format)]
+lossy_formats = ["WebP", "JPEG", "AVIF"]
+thumbnail_formats = [codec_format for codec_format in ["WebP", "JPEG", "PNG"] if format_supported(codec_format)]
+
+extensions = {
+    "PNG": "png",
+    "WebP (lossless)": "webp",
+    "WebP": "webp",
+    "JPEG": "jpg",
+    "AVIF": "avif",
+    "Raw": "raw",
+}
+
+content_types = {
+    "PNG": "image/png",
+    "WebP (lossless)": "image/webp",
+    "WebP": "image/webp",
+    "JPEG": "image/jpeg",
+    "AVIF": "image/avif",
+    "Raw": "application/octet-stream",
+}
+
+
+def make_codec(codec_format, png_compress_level=6, quality=90):
+    if codec_format == "PNG":
+        return ImageCodec(codec_format, int(png_compress_level))
+    if codec_format in lossy_formats:
+        return ImageCodec(codec_format, int(quality))
+    return ImageCodec(codec_format, 0)
+
+
+def infotext_exif(infotext):
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0x9286] = b"UNICODE\0" + infotext.encode("utf-16-be")
+    return exif.tobytes()
+
+
+def encode(image, codec, infotext=None):
+    if codec.format == "Raw":
+        return image.tobytes()
+
+    buffer = BytesIO()
+    if codec.format == "PNG":
+        pnginfo = PngInfo()
+        if infotext:
+            pnginfo.add_text("parameters", infotext)
+        image.save(buffer, "png", compress_level=codec.level, pnginfo=pnginfo)
+        return buffer.getvalue()
+
+    exif = infotext_exif(infotext) if infotext else b""
+    if codec.format == "WebP (lossless)":
+        image.save(buffer, "webp", lossless=True, exif=exif)
+    elif codec.format == "WebP":
+        image.save(buffer, "webp", quality=codec.level, exif=exif)
+    elif codec.format == "JPEG":
+        image.convert("RGB").save(buffer, "jpeg", quality=codec.level, exif=exif)
+    elif codec.format == "AVIF":
+        image.save(buffer, "avif", quality=codec.level, exif=exif)
+    else:
+        raise ValueError(f"Unknown image codec: {codec.format}")
+    return buffer.getvalue()
+
+
+def thumbnail(image, size, codec):
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return encode(image, codec)
+
+
+def decode(image_bytes, size=None):
+    try:
+        return Image.open(BytesIO(image_bytes))
+    except UnidentifiedImageError:
+        if not size:
+            raise
+
+    mode = "RGBA" if len(image_bytes) == size[0] * size[1] * 4 else "RGB"
+    return Image.frombytes(mode, size, image_bytes)
@@ -0,0 +1,104 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import gradio as gr
+import importlib
+import logging
+import threading
+import time
+from modules import shared
+from .circuit_breaker import CircuitBreaker
+from .metrics import stage_metrics
+from .prepared_record import database_codec
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LazyDatabase:
+
+    def __init__(self, name, key, module, class_name, options):
+        self.name = name
+        self.key = key
+        self.module = module
+        self.class_name = class_name
+        self.circuit_breaker = CircuitBreaker(name)
+        self.backend = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+        shared.options_templates.update(shared.options_section(('nex-databases', "Nex databases"), options(self)))
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('backend', 'lock'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def load(self):
+        with self.lock:
+            if self.backend is None:
+                started = time.perf_counter()
+                with stage_metrics.measure(self.name, "load"):
+                    module = importlib.import_module(self.module, __package__)
+                    self.backend = getattr(module, self.class_name)(self.circuit_breaker)
+                self.load_seconds = time.perf_counter() - started
+                logger.info(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+            return self.backend
+
+    def loaded(self):
+        return self.backend is not None
+
+    def loaded_status(self, method, default):
+        if not self.loaded():
+            return default
+        return getattr(self.backend, method)()
+
+    def enabled(self):
+        return getattr(shared.opts, f'nex_databases_enable_{self.key}')
+
+    def codec(self):
+        return database_codec(self.key)
+
+    def test_connectivity(self):
+        try:
+            backend = self.load()
+        except Exception as e:
+            message = f"Error loading {self.name}: {str(e)}"
+            gr.Warning(message)
+            return message
+        return backend.test_connectivity()
+
+    def migrate_table(self):
+        try:
+            backend = self.load()
+        except Exception as e:
+            message = f"Error loading {self.name}: {str(e)}"
+            gr.Warning(message)
+            return message
+        return backend.migrate_table()
+
+    def dispose(self):
+        if self.loaded():
+            self.backend.dispose()
@@ -0,0 +1,229 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import bisect
+from contextlib import contextmanager
+import threading
+import time
+from modules import shared
+from .setting_button import OptionButton, OptionStatus
+
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+bytes_buckets = tuple(1024 * 4 ** exponent for exponent in range(11))
+rows_buckets = tuple(2 ** exponent for exponent in range(11))
+
+
+def payload_size(value):
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    return 0
+
+
+def size_text(size):
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f}MB"
+    return f"{size / 1024:.1f}KB"
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values):
+    return "{" + ",".join(f'{name}="{label_value(value)}"' for name, value in values.items()) + "}"
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def lines(self, name, **label_values):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{labels(**label_values, le=f'{bound:g}')} {cumulative}"
+        yield f"{name}_bucket{labels(**label_values, le='+Inf')} {self.count}"
+        yield f"{name}_sum{labels(**label_values)} {self.sum:g}"
+        yield f"{name}_count{labels(**label_values)} {self.count}"
+
+
+class StageMetrics:
+
+    name = "Metrics"
+    endpoint_path = "/nex-databases/metrics"
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_enable_metrics': shared.OptionInfo(
+                        True, f'Collect Write Stage Timings (shown below and served at {self.endpoint_path})'
+                    ),
+                    f'nex_databases_status_metrics': OptionStatus(self.summary),
+                    f'nex_databases_reset_button_metrics': OptionButton('Reset - Metrics!', self.reset),
+                }
+            )
+        )
+
+    def enabled(self):
+        return shared.opts.nex_databases_enable_metrics
+
+    def reset(self):
+        with self.lock:
+            self.latencies = {}
+            self.bytes = {}
+            self.rows = {}
+            self.errors = {}
+
+    @contextmanager
+    def measure(self, backend, stage):
+        if not self.enabled():
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record_error(backend, stage)
+            raise
+        finally:
+            self.observe(backend, stage, time.perf_counter() - started)
+
+    def observe(self, backend, stage, seconds):
+        with self.lock:
+            histogram = self.latencies.get((backend, stage))
+            if histogram is None:
+                histogram = self.latencies[(backend, stage)] = Histogram(latency_buckets)
+            histogram.observe(seconds)
+
+    def record_error(self, backend, stage):
+        if not self.enabled():
+            return
+        with self.lock:
+            self.errors[(backend, stage)] = self.errors.get((backend, stage), 0) + 1
+
+    def record_write(self, backend, rows, size):
+        if not self.enabled():
+            return
+        with self.lock:
+            if backend not in self.rows:
+                self.rows[backend] = Histogram(rows_buckets)
+                self.bytes[backend] = Histogram(bytes_buckets)
+            self.rows[backend].observe(rows)
+            self.bytes[backend].observe(size)
+
+    def summary(self):
+        if not self.enabled():
+            return f"{self.name} are disabled"
+
+        with self.lock:
+            parts = []
+            for (backend, stage), histogram in self.latencies.items():
+                part = (
+                    f"{backend} {stage}: {histogram.count}x, avg {histogram.sum / histogram.count * 1000:.1f}ms, "
+                    f"p95 {histogram.quantile(0.95) * 1000:.1f}ms"
+                )
+                if self.errors.get((backend, stage)):
+                    part += f", {self.errors[(backend, stage)]} errors"
+                parts.append(part)
+            for (backend, stage), errors in self.errors.items():
+                if (backend, stage) not in self.latencies:
+                    parts.append(f"{backend} {stage}: {errors} errors")
+            for backend, histogram in self.rows.items():
+                parts.append(f"{backend} wrote {histogram.sum:.0f} rows, {size_text(self.bytes[backend].sum)}")
+
+        return "; ".join(parts) or "No writes measured yet"
+
+    def exposition(self):
+        lines = [
+            "# HELP nex_databases_stage_seconds Time spent in each stage of writing images.",
+            "# TYPE nex_databases_stage_seconds histogram",
+        ]
+        with self.lock:
+            for (backend, stage), histogram in self.latencies.items():
+                lines += histogram.lines("nex_databases_stage_seconds", backend=backend, stage=stage)
+
+            lines += [
+                "# HELP nex_databases_write_rows Rows written per insert.",
+                "# TYPE nex_databases_write_rows histogram",
+            ]
+            for backend, histogram in self.rows.items():
+                lines += histogram.lines("nex_databases_write_rows", backend=backend)
+
+            lines += [
+                "# HELP nex_databases_write_bytes Bytes written per insert.",
+                "# TYPE nex_databases_write_bytes histogram",
+            ]
+            for backend, histogram in self.bytes.items():
+                lines += histogram.lines("nex_databases_write_bytes", backend=backend)
+
+            lines += [
+                "# HELP nex_databases_errors_total Failed stages of writing images.",
+                "# TYPE nex_databases_errors_total counter",
+            ]
+            for (backend, stage), errors in self.errors.items():
+                lines.append(f"nex_databases_errors_total{labels(backend=backend, stage=stage)} {errors}")
+
+        return "\n".join(lines) + "\n"
+
+    def on_app_started(self, demo, app):
+        from fastapi import Response
+
+        def metrics():
+            if not self.enabled():
+                return Response(status_code=404)
+            return Response(self.exposition(), media_type=self.content_type)
+
+        app.add_api_route(self.endpoint_path, metrics, methods=["GET"])
+
+
+stage_metrics = StageMetrics()
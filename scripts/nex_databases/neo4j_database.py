@@ -25,15 +25,17 @@ SOFTWARE.
 """
 
 import gradio as gr
-import os
-import json
+from io import BytesIO
 import logging
 from neo4j import GraphDatabase
 import ipfshttpclient
-import tempfile
-from modules import generation_parameters_copypaste
+import threading
 from modules import shared
-from .setting_button import OptionButton
+from .connection_pool import PooledConnection, pool_settings
+from .deduplication import deduplication_stats
+from .metrics import payload_size, stage_metrics
+from .prepared_record import database_codec, thumbnail_sizes
+from .search import SearchResult, load_metadata, metadata_pattern
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,88 +44,224 @@ logger = logging.getLogger(__name__)
 class Neo4jDatabase:
 
     name = "Neo4j"
-    driver = None
-    session_instance = None
+    key = "neo4j"
+    blob_references = False
     components = None
+    schema_queries = [
+        "CREATE CONSTRAINT nex_prompt_content IF NOT EXISTS FOR (p:Prompt) REQUIRE p.content IS UNIQUE",
+        "CREATE INDEX nex_image_ipfs_hash IF NOT EXISTS FOR (i:Image) ON (i.ipfs_hash)",
+        "CREATE CONSTRAINT nex_image_hash IF NOT EXISTS FOR (i:Image) REQUIRE i.image_hash IS UNIQUE",
+    ]
+    schema_names = ["nex_prompt_content", "nex_image_ipfs_hash", "nex_image_hash"]
+    insert_query = """
+    UNWIND $rows AS row
+    MERGE (p:Prompt {content: row.prompt_content})
+    MERGE (image:Image {image_hash: row.image_hash})
+    ON CREATE SET image.metadata = row.metadata, image.ipfs_hash = row.ipfs_hash, image += row.thumbnails
+    MERGE (p)-[:RELATED_TO]->(image)
+    """
+    existing_query = """
+    MATCH (image:Image) WHERE image.image_hash IN $hashes
+    RETURN image.image_hash AS image_hash
+    """
+    search_query = """
+    MATCH (image:Image)
+    WHERE image.image_hash IS NOT NULL
+    AND ($cursor IS NULL OR image.image_hash > $cursor)
+    AND ($seed IS NULL OR image.metadata CONTAINS $seed)
+    AND ($model_hash IS NULL OR image.metadata CONTAINS $model_hash)
+    AND ($prompt IS NULL OR ANY(content IN [(p:Prompt)-[:RELATED_TO]->(image) | p.content] WHERE toLower(content) CONTAINS $prompt))
+    RETURN image.image_hash AS image_hash, image.metadata AS metadata, image[$thumbnail] AS thumbnail
+    ORDER BY image.image_hash
+    LIMIT $limit
+    """
+    ipfs_hash_query = """
+    MATCH (image:Image {image_hash: $image_hash})
+    RETURN image.ipfs_hash AS ipfs_hash
+    """
 
-    def __init__(self):
-        shared.options_templates.update(
-            shared.options_section(
-                ('nex-databases', "Nex databases"), {
-                    f'nex_databases_enable_neo4j': shared.OptionInfo(False, 'Enable - Neo4j'),
-                    f'nex_databases_connection_string_neo4j': shared.OptionInfo(
-                        "", 'connection String - Neo4j', gr.Textbox,
-                        {'placeholder': 'bolt://localhost:7687'}
-                    ),
-                    f'nex_databases_user_name_neo4j': shared.OptionInfo("", 'Username - Neo4j'),
-                    f'nex_databases_password_neo4j': shared.OptionInfo("", 'Password - Neo4j'),
-                    f'nex_databases_test_button_neo4j': OptionButton('Test - Neo4j!', self.test_connectivity),
-                }
-            )
-        )
+    def __init__(self, circuit_breaker):
+        self.pool = PooledConnection(self.name, self.create_driver, lambda driver: driver.close())
+        self.circuit_breaker = circuit_breaker
+        self.ipfs_pool = PooledConnection("IPFS", self.create_ipfs_client, lambda client: client.close())
+        self.schema_ready = None
+        self.schema_lock = threading.Lock()
 
-    def instance(self):
-        self.driver = GraphDatabase.driver(
+    def create_driver(self):
+        pool_size, pre_ping, recycle = pool_settings()
+        options = {'max_connection_pool_size': pool_size}
+        if pre_ping:
+            options['liveness_check_timeout'] = 0
+        if recycle > 0:
+            options['max_connection_lifetime'] = recycle
+        return GraphDatabase.driver(
             shared.opts.nex_databases_connection_string_neo4j,
-            auth=(shared.opts.nex_databases_user_name_neo4j, shared.opts.nex_databases_password_neo4j)
+            auth=(shared.opts.nex_databases_user_name_neo4j, shared.opts.nex_databases_password_neo4j),
+            **options
         )
-        self.session_instance = self.driver.session()
+
+    def connection_settings(self):
+        return (
+            shared.opts.nex_databases_connection_string_neo4j,
+            shared.opts.nex_databases_user_name_neo4j,
+            shared.opts.nex_databases_password_neo4j,
+        ) + pool_settings()
+
+    def create_ipfs_client(self):
+        return ipfshttpclient.connect(shared.opts.nex_databases_ipfs_address_neo4j, session=True)
+
+    def ipfs_client(self):
+        return self.ipfs_pool.get((shared.opts.nex_databases_ipfs_address_neo4j,))
+
+    def instance(self):
+        return self.pool.get(self.connection_settings()).session()
+
+    def warm_up(self):
+        self.pool.get(self.connection_settings()).verify_connectivity()
+        self.ipfs_client()
 
     def test_connectivity(self):
+        session = self.instance()
         try:
-            self.instance()
-            self.session_instance.run("RETURN 1 AS connectivity_test")
+            session.run("RETURN 1 AS connectivity_test")
+            self.circuit_breaker.record_success()
             message = f"Connected successfully to {self.name}!"
             gr.Info(message)
         except Exception as e:
             message = f"Error connecting to {self.name}: {str(e)}"
             gr.Warning(message)
         finally:
-            self.close()
+            session.close()
 
-    def insert(self, processed):
-        if not shared.opts.nex_databases_enable_neo4j:
-            return
+    def enabled(self):
+        return shared.opts.nex_databases_enable_neo4j
 
-        self.instance()
+    def codec(self):
+        return database_codec(self.key)
 
-        try:
-            with ipfshttpclient.connect() as client:
-                for i in range(len(processed.images)):
+    def insert(self, batch):
+        if not self.enabled():
+            return
 
-                    metadata = json.dumps(generation_parameters_copypaste.parse_generation_parameters(processed.infotexts[i]))
+        session = self.instance()
 
-                    image = processed.images[i]
+        try:
+            self.ensure_schema(session)
 
-                    temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-                    image.save(temp_file, 'PNG')
+            result = session.run(self.existing_query, hashes=[record.image_hash for record in batch.records])
+            seen = set(row["image_hash"] for row in result)
 
-                    response = client.add(temp_file.name)
-                    ipfs_hash = response['Hash']
+            new_records = []
+            for record in batch.records:
+                if record.image_hash in seen:
+                    continue
+                seen.add(record.image_hash)
+                new_records.append(record)
 
-                    cypher_query = """
-                    MERGE (p:Prompt {content: $prompt_content})
-                    CREATE (image:Image {metadata: $metadata, ipfs_hash: $ipfs_hash})
-                    MERGE (p)-[:RELATED_TO]->(image)
-                    RETURN image
-                    """
+            with stage_metrics.measure(self.name, "ipfs_add"):
+                ipfs_hashes = dict(zip(
+                    [record.image_hash for record in new_records],
+                    self.add_to_ipfs(new_records)
+                ))
+            rows = [
+                {
+                    "prompt_content": record.prompt,
+                    "metadata": record.metadata_json,
+                    "image_hash": record.image_hash,
+                    "ipfs_hash": ipfs_hashes.get(record.image_hash),
+                    "thumbnails": {f"thumbnail_{size}": thumbnail for size, thumbnail in record.thumbnails.items()},
+                }
+                for record in batch.records
+            ]
 
-                    self.session_instance.run(
-                        cypher_query,
-                        prompt_content=processed.prompt,
-                        metadata=metadata,
-                        ipfs_hash=ipfs_hash
-                    )
+            with stage_metrics.measure(self.name, "insert"), session.begin_transaction() as tx:
+                tx.run(self.insert_query, rows=rows)
+                tx.commit()
+            stage_metrics.record_write(
+                self.name, len(new_records),
+                sum(len(record.image_bytes) for record in new_records) + sum(payload_size(row) for row in rows)
+            )
 
-            self.close()
+            deduplication_stats.record(self.name, len(batch.records), len(batch.records) - len(new_records))
         except Exception as e:
-            print(f"Error inserting of data: {e}")
+            logger.error(f"Error inserting data: {e}")
+            raise e
         finally:
-            temp_file.close()
-            os.remove(temp_file.name)
-
-    def close(self):
-        if self.session_instance:
-            self.session_instance.close()
-        if self.driver:
-            self.driver.close()
+            session.close()
+
+    def add_to_ipfs(self, records):
+        if not records:
+            return []
+
+        files = []
+        for record in records:
+            file = BytesIO(record.image_bytes)
+            file.name = f"{record.image_hash}.{record.extension}"
+            files.append(file)
+
+        response = self.ipfs_client().add(*files, pin=bool(shared.opts.nex_databases_ipfs_pin_neo4j))
+        if not isinstance(response, list):
+            response = [response]
+
+        if len(response) != len(records):
+            raise RuntimeError(f"IPFS returned {len(response)} hashes for {len(records)} images")
+        return [entry['Hash'] for entry in response]
+
+    def ensure_schema(self, session):
+        settings = self.connection_settings()
+        with self.schema_lock:
+            if self.schema_ready == settings:
+                return
+
+            with stage_metrics.measure(self.name, "schema"):
+                for query in self.schema_queries:
+                    session.run(query).consume()
+                session.run("CALL db.awaitIndexes(300)").consume()
+
+                result = session.run(
+                    "SHOW INDEXES YIELD name, state WHERE name IN $names RETURN name, state",
+                    names=self.schema_names
+                )
+                states = {row["name"]: row["state"] for row in result}
+
+            missing = [name for name in self.schema_names if states.get(name) != "ONLINE"]
+            if missing:
+                logger.warning(f"{self.name} indexes are not online yet: {', '.join(missing)}")
+                return
+
+            self.schema_ready = settings
+
+    def search(self, query, cursor, limit):
+        if query.date_from or query.date_to:
+            raise ValueError(f"{self.name} does not store dates to filter by")
+
+        sizes = thumbnail_sizes()
+        with self.instance() as session:
+            rows = list(session.run(
+                self.search_query,
+                cursor=cursor,
+                prompt=query.prompt.lower() or None,
+                seed=metadata_pattern("Seed", query.seed) if query.seed else None,
+                model_hash=metadata_pattern("Model hash", query.model_hash) if query.model_hash else None,
+                thumbnail=f"thumbnail_{sizes[0]}" if sizes else "",
+                limit=limit + 1,
+            ))
+
+        results = [
+            SearchResult(row["image_hash"], row["image_hash"], load_metadata(row["metadata"]), None, row["thumbnail"])
+            for row in rows[:limit]
+        ]
+        next_cursor = results[-1].key if len(rows) > limit else None
+        return results, next_cursor
+
+    def read_image(self, key):
+        with self.instance() as session:
+            row = session.run(self.ipfs_hash_query, image_hash=key).single()
+
+        if row is None or not row["ipfs_hash"]:
+            return
+        yield from self.ipfs_client().cat(row["ipfs_hash"], stream=True)
+
+    def dispose(self):
+        self.pool.dispose()
+        self.ipfs_pool.dispose()
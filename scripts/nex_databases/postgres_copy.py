@@ -0,0 +1,108 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+from datetime import datetime, timezone
+import json
+import struct
+from sqlalchemy import BigInteger, DateTime, Float, Integer, JSON, LargeBinary, SmallInteger, String
+from sqlalchemy.dialects.postgresql import JSONB, REAL
+
+copy_header = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+copy_trailer = struct.pack(">h", -1)
+copy_null = struct.pack(">i", -1)
+postgres_epoch = datetime(2000, 1, 1)
+
+
+def json_text(value):
+    return (value if isinstance(value, str) else json.dumps(value)).encode("utf-8")
+
+
+def timestamp(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - postgres_epoch
+    return struct.pack(">q", (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def copy_encoder(column_type):
+    if isinstance(column_type, JSONB):
+        return lambda value: b"\x01" + json_text(value)
+    if isinstance(column_type, JSON):
+        return json_text
+    if isinstance(column_type, LargeBinary):
+        return bytes
+    if isinstance(column_type, BigInteger):
+        return struct.Struct(">q").pack
+    if isinstance(column_type, SmallInteger):
+        return struct.Struct(">h").pack
+    if isinstance(column_type, Integer):
+        return struct.Struct(">i").pack
+    if isinstance(column_type, REAL):
+        return struct.Struct(">f").pack
+    if isinstance(column_type, Float):
+        return struct.Struct(">d").pack
+    if isinstance(column_type, DateTime):
+        return timestamp
+    if isinstance(column_type, String):
+        return lambda value: value.encode("utf-8")
+    raise TypeError(f"No binary COPY encoding for {column_type}")
+
+
+def copy_chunks(rows, names, encoders):
+    yield copy_header
+    field_count = struct.pack(">h", len(names))
+    for row in rows:
+        parts = [field_count]
+        for name, encode in zip(names, encoders):
+            value = row[name]
+            if value is None:
+                parts.append(copy_null)
+                continue
+            data = encode(value)
+            parts.append(struct.pack(">i", len(data)))
+            parts.append(data)
+        yield b"".join(parts)
+    yield copy_trailer
+
+
+class CopyStream:
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
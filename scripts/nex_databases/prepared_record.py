@@ -0,0 +1,269 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import threading
+from modules import generation_parameters_copypaste
+from modules import shared
+from .metrics import stage_metrics
+from .image_codec import ImageCodec, codec_formats, content_types, encode, extensions, format_supported, make_codec, thumbnail, thumbnail_formats
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+unsupported_warnings = set()
+
+
+def reject_unsupported_format(option_name):
+    def check():
+        codec_format = getattr(shared.opts, option_name)
+        if not format_supported(codec_format):
+            raise ValueError(f"This Pillow version cannot write {codec_format} images")
+    return check
+
+
+def supported_format(option_name, fallback):
+    codec_format = getattr(shared.opts, option_name)
+    if format_supported(codec_format):
+        return codec_format
+    if option_name not in unsupported_warnings:
+        unsupported_warnings.add(option_name)
+        logger.warning(f"This Pillow version cannot write {codec_format} images, writing {fallback} instead")
+    return fallback
+
+
+def codec_options(key, name):
+    return {
+        f'nex_databases_codec_{key}': shared.OptionInfo(
+            "PNG", f'Image Format - {name}', gr.Radio,
+            {'choices': codec_formats}, onchange=reject_unsupported_format(f'nex_databases_codec_{key}')
+        ),
+        f'nex_databases_png_compress_level_{key}': shared.OptionInfo(
+            6, f'PNG Compress Level - {name}', gr.Slider,
+            {'minimum': 0, 'maximum': 9, 'step': 1}
+        ),
+        f'nex_databases_quality_{key}': shared.OptionInfo(
+            90, f'Quality For WebP, JPEG And AVIF - {name}', gr.Slider,
+            {'minimum': 1, 'maximum': 100, 'step': 1}
+        ),
+    }
+
+
+def database_codec(key):
+    return make_codec(
+        supported_format(f'nex_databases_codec_{key}', "PNG"),
+        getattr(shared.opts, f'nex_databases_png_compress_level_{key}'),
+        getattr(shared.opts, f'nex_databases_quality_{key}'),
+    )
+
+
+def thumbnail_sizes():
+    sizes = set()
+    for size in shared.opts.nex_databases_thumbnail_sizes.split(","):
+        size = size.strip()
+        if size.isdigit() and int(size) > 0:
+            sizes.add(int(size))
+    return sorted(sizes)
+
+
+def thumbnail_codec():
+    return make_codec(
+        supported_format('nex_databases_thumbnail_format', thumbnail_formats[-1]),
+        quality=shared.opts.nex_databases_thumbnail_quality
+    )
+
+
+typed_metadata_fields = {
+    'seed': ('Seed', int),
+    'steps': ('Steps', int),
+    'sampler': ('Sampler', str),
+    'cfg_scale': ('CFG scale', float),
+    'width': ('Size-1', int),
+    'height': ('Size-2', int),
+    'model_hash': ('Model hash', str),
+}
+
+
+def typed_metadata(metadata):
+    values = {}
+    for role, (field, convert) in typed_metadata_fields.items():
+        try:
+            value = convert(metadata[field]) if field in metadata else None
+        except (TypeError, ValueError):
+            value = None
+        values[role] = value[:64] if isinstance(value, str) else value
+    return values
+
+
+class PreparedRecord:
+
+    def __init__(self, image_bytes, codec, infotext, metadata, metadata_json, prompt, thumbnails=None):
+        self.image_bytes = image_bytes
+        self.image_hash = hashlib.sha256(image_bytes).hexdigest()
+        self.codec = codec
+        self.content_type = content_types[codec.format]
+        self.extension = extensions[codec.format]
+        self.infotext = infotext
+        self.metadata = metadata
+        self.metadata_json = metadata_json
+        self.typed_metadata = typed_metadata(metadata)
+        self.created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.prompt = prompt
+        self.thumbnails = thumbnails or {}
+        self.blob_key = None
+        self.blob_size = None
+
+    def to_dict(self):
+        return {
+            'image_bytes': self.image_bytes,
+            'codec': tuple(self.codec),
+            'infotext': self.infotext,
+            'metadata': self.metadata,
+            'metadata_json': self.metadata_json,
+            'prompt': self.prompt,
+            'thumbnails': self.thumbnails,
+            'created_at': self.created_at,
+            'blob_key': self.blob_key,
+            'blob_size': self.blob_size,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(
+            data['image_bytes'], ImageCodec(*data['codec']), data['infotext'], data['metadata'],
+            data['metadata_json'], data['prompt'], data.get('thumbnails')
+        )
+        record.created_at = data.get('created_at') or record.created_at
+        record.blob_key = data.get('blob_key')
+        record.blob_size = data.get('blob_size')
+        return record
+
+
+class PreparedBatch:
+
+    def __init__(self, records, prompt):
+        self.records = records
+        self.prompt = prompt
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_dict(self):
+        return {'records': [record.to_dict() for record in self.records], 'prompt': self.prompt}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([PreparedRecord.from_dict(record) for record in data['records']], data['prompt'])
+
+
+class RecordPreparer:
+
+    name = "Record Preparer"
+
+    def __init__(self):
+        self.executor = None
+        self.executor_workers = None
+        self.lock = threading.Lock()
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_workers_encoder': shared.OptionInfo(
+                        4, 'Image Encoding Threads', gr.Slider,
+                        {'minimum': 1, 'maximum': 16, 'step': 1}
+                    ),
+                    f'nex_databases_thumbnail_sizes': shared.OptionInfo(
+                        "", 'Thumbnail Sizes In Pixels (comma separated, empty for none)', gr.Textbox,
+                        {'placeholder': '128, 256'}
+                    ),
+                    f'nex_databases_thumbnail_format': shared.OptionInfo(
+                        thumbnail_formats[0], 'Thumbnail Format', gr.Radio,
+                        {'choices': thumbnail_formats}, onchange=reject_unsupported_format('nex_databases_thumbnail_format')
+                    ),
+                    f'nex_databases_thumbnail_quality': shared.OptionInfo(
+                        80, 'Thumbnail Quality For WebP And JPEG', gr.Slider,
+                        {'minimum': 1, 'maximum': 100, 'step': 1}
+                    ),
+                }
+            )
+        )
+
+    def pool(self):
+        workers = int(shared.opts.nex_databases_workers_encoder)
+        with self.lock:
+            if self.executor is None or self.executor_workers != workers:
+                if self.executor:
+                    self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nex-databases-encoder")
+                self.executor_workers = workers
+            return self.executor
+
+    def prepare(self, batch, codecs):
+        metadata = [generation_parameters_copypaste.parse_generation_parameters(infotext) for infotext in batch.infotexts]
+        metadata_json = [json.dumps(item) for item in metadata]
+        prompts = getattr(batch, 'prompts', None) or [batch.prompt] * len(batch.images)
+
+        sizes = thumbnail_sizes()
+        codec_for_thumbnails = thumbnail_codec()
+
+        def prepare_thumbnails(i):
+            with stage_metrics.measure(self.name, "thumbnail"):
+                return {size: thumbnail(batch.images[i], size, codec_for_thumbnails) for size in sizes}
+
+        thumbnails = self.run(prepare_thumbnails, list(range(len(batch.images)))) if sizes else [{}] * len(batch.images)
+
+        def prepare_record(task):
+            i, codec = task
+            with stage_metrics.measure(self.name, "encode"):
+                image_bytes = encode(batch.images[i], codec, batch.infotexts[i])
+            record = PreparedRecord(image_bytes, codec, batch.infotexts[i], metadata[i], metadata_json[i], prompts[i], thumbnails[i])
+            if getattr(batch, 'created_at', None):
+                record.created_at = batch.created_at[i]
+            return record
+
+        tasks = [(i, codec) for codec in codecs for i in range(len(batch.images))]
+        records = self.run(prepare_record, tasks)
+
+        batches = {codec: PreparedBatch([], batch.prompt) for codec in codecs}
+        for (i, codec), record in zip(tasks, records):
+            batches[codec].records.append(record)
+        return batches
+
+    def run(self, function, items):
+        if len(items) > 1:
+            return list(self.pool().map(function, items))
+        return [function(item) for item in items]
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=True)
+                self.executor = None
@@ -0,0 +1,77 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import json
+
+SearchQuery = namedtuple("SearchQuery", ["prompt", "seed", "model_hash", "date_from", "date_to"])
+SearchResult = namedtuple("SearchResult", ["key", "image_hash", "metadata", "created_at", "thumbnail"])
+
+empty_query = SearchQuery("", "", "", None, None)
+
+date_formats = ["%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+
+def parse_date(value, end=False):
+    value = value.strip()
+    if not value:
+        return None
+
+    for date_format in date_formats:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        if end and date_format == "%Y-%m-%d":
+            parsed += timedelta(days=1)
+        return parsed
+
+    raise ValueError(f"Dates must look like YYYY-MM-DD or YYYY-MM-DD HH:MM, not {value}")
+
+
+def make_query(prompt, seed, model_hash, date_from, date_to):
+    seed = seed.strip()
+    if seed and not seed.lstrip("-").isdigit():
+        raise ValueError(f"Seed must be a number, not {seed}")
+
+    return SearchQuery(prompt.strip(), seed, model_hash.strip(), parse_date(date_from), parse_date(date_to, end=True))
+
+
+def json_fragment(value, ensure_ascii=True):
+    return json.dumps(value, ensure_ascii=ensure_ascii)[1:-1]
+
+
+def metadata_pattern(field, value, ensure_ascii=True):
+    return f"{json.dumps(field, ensure_ascii=ensure_ascii)}: {json.dumps(value, ensure_ascii=ensure_ascii)}"
+
+
+def load_metadata(value):
+    if value is None:
+        return {}
+    if isinstance(value, (bytes, str)):
+        return json.loads(value)
+    return dict(value)
@@ -24,6 +24,7 @@ SOFTWARE.
 
 """
 
+import html
 from modules import shared
 import gradio as gr
 
@@ -38,3 +39,14 @@ class OptionButton(shared.OptionInfo):
     def __init__(self, text, on_button_click):
         super().__init__(str(text).strip(), label='', component=lambda **kwargs: self.button_on_click(on_button_click, **kwargs))
         self.do_not_save = True
+
+
+class OptionStatus(shared.OptionInfo):
+    @staticmethod
+    def status_html(get_status, every, **kwargs):
+        kwargs['value'] = lambda: f"<p>{html.escape(get_status())}</p>"
+        return gr.HTML(every=every, **kwargs)
+
+    def __init__(self, get_status, every=5):
+        super().__init__("", label='', component=lambda **kwargs: self.status_html(get_status, every, **kwargs))
+        self.do_not_save = True
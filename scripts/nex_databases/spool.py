@@ -0,0 +1,231 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from modules import shared
+from .blob_store import blob_references, blob_store
+from .prepared_record import PreparedBatch
+from .setting_button import OptionButton
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+default_spool_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "spool", "spool.db")
+
+
+class Spool:
+
+    name = "Spool"
+
+    def __init__(self, databases, fan_out):
+        self.databases = databases
+        self.fan_out = fan_out
+        self.connection = None
+        self.connection_path = None
+        self.lock = threading.Lock()
+        self.replayer = None
+        self.stopped = threading.Event()
+        self.evicted = 0
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_enable_spool': shared.OptionInfo(True, 'Enable - Spool Failed Writes To Disk'),
+                    f'nex_databases_path_spool': shared.OptionInfo(
+                        "", 'Spool File - Spool', gr.Textbox,
+                        {'placeholder': default_spool_path}
+                    ),
+                    f'nex_databases_max_megabytes_spool': shared.OptionInfo(
+                        1024, 'Max Size (MB) - Spool', gr.Slider,
+                        {'minimum': 16, 'maximum': 65536, 'step': 16}
+                    ),
+                    f'nex_databases_replay_interval_spool': shared.OptionInfo(
+                        30, 'Replay Interval (seconds) - Spool', gr.Slider,
+                        {'minimum': 1, 'maximum': 3600, 'step': 1}
+                    ),
+                    f'nex_databases_replay_batches_spool': shared.OptionInfo(
+                        16, 'Batches Replayed Per Database Per Interval - Spool', gr.Slider,
+                        {'minimum': 1, 'maximum': 256, 'step': 1}
+                    ),
+                    f'nex_databases_status_button_spool': OptionButton('Status - Spool!', self.show_status),
+                }
+            )
+        )
+
+    def path(self):
+        return shared.opts.nex_databases_path_spool or default_spool_path
+
+    def instance(self):
+        path = self.path()
+        if self.connection is None or self.connection_path != path:
+            if self.connection:
+                self.connection.close()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, database TEXT NOT NULL, created REAL NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, size INTEGER NOT NULL, payload BLOB NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS ix_spool_database ON spool (database, id)")
+            self.connection_path = path
+        return self.connection
+
+    def enabled(self):
+        return shared.opts.nex_databases_enable_spool
+
+    def append(self, database, batch):
+        if not self.enabled():
+            return False
+
+        payload = pickle.dumps(batch.to_dict(), protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            connection = self.instance()
+            connection.execute(
+                "INSERT INTO spool (database, created, size, payload) VALUES (?, ?, ?, ?)",
+                (database.name, time.time(), len(payload), payload)
+            )
+            self.enforce_limit(connection)
+
+        logger.warning(f"Spooled a batch of {len(batch)} images for {database.name}")
+        self.start()
+        return True
+
+    def enforce_limit(self, connection):
+        max_bytes = int(shared.opts.nex_databases_max_megabytes_spool) * 1024 * 1024
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM spool").fetchone()[0]
+        while total > max_bytes:
+            row = connection.execute("SELECT id, database, size FROM spool ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                break
+            connection.execute("DELETE FROM spool WHERE id = ?", (row[0],))
+            total -= row[2]
+            self.evicted += 1
+            logger.warning(f"{self.name} is over {max_bytes // (1024 * 1024)} MB, discarded the oldest batch for {row[1]}")
+
+    def pending(self, database_name, limit):
+        with self.lock:
+            return self.instance().execute(
+                "SELECT id, payload FROM spool WHERE database = ? ORDER BY id LIMIT ?",
+                (database_name, limit)
+            ).fetchall()
+
+    def remove(self, entry_id):
+        with self.lock:
+            self.instance().execute("DELETE FROM spool WHERE id = ?", (entry_id,))
+
+    def record_attempt(self, entry_id):
+        with self.lock:
+            self.instance().execute("UPDATE spool SET attempts = attempts + 1 WHERE id = ?", (entry_id,))
+
+    def replay(self):
+        limit = int(shared.opts.nex_databases_replay_batches_spool)
+        for database in self.databases:
+            if not database.enabled():
+                continue
+
+            for entry_id, payload in self.pending(database.name, limit):
+                try:
+                    batch = PreparedBatch.from_dict(pickle.loads(payload))
+                except Exception as e:
+                    logger.error(f"Discarding unreadable spooled batch {entry_id} for {database.name}: {e}")
+                    self.remove(entry_id)
+                    continue
+
+                self.store_blobs(database, batch)
+                if self.fan_out.write({database: batch}):
+                    self.record_attempt(entry_id)
+                    break
+                self.remove(entry_id)
+                logger.info(f"Replayed a spooled batch of {len(batch)} images into {database.name}")
+
+    def store_blobs(self, database, batch):
+        records = [record for record in batch.records if not record.blob_key]
+        if not records or not blob_store.enabled() or not blob_references(database):
+            return
+        try:
+            blob_store.put_records(records)
+        except Exception as e:
+            logger.error(f"Error writing spooled images to the {blob_store.name}, storing them in {database.name} instead: {e}")
+
+    def work(self):
+        while not self.stopped.wait(float(shared.opts.nex_databases_replay_interval_spool)):
+            try:
+                self.replay()
+            except Exception as e:
+                logger.error(f"Error replaying the spool: {e}")
+
+    def start(self):
+        with self.lock:
+            if self.replayer is not None and self.replayer.is_alive():
+                return
+            self.stopped.clear()
+            self.replayer = threading.Thread(target=self.work, name="nex-databases-spool-replayer", daemon=True)
+            self.replayer.start()
+
+    def resume(self):
+        if self.enabled() and os.path.exists(self.path()):
+            self.start()
+
+    def shutdown(self):
+        self.stopped.set()
+        with self.lock:
+            replayer = self.replayer
+            self.replayer = None
+        if replayer is not None:
+            replayer.join(timeout=5)
+        with self.lock:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+
+    def status(self):
+        with self.lock:
+            rows = self.instance().execute(
+                "SELECT database, COUNT(*), COALESCE(SUM(size), 0), MIN(created) FROM spool GROUP BY database"
+            ).fetchall()
+        return {database: (count, size, time.time() - oldest) for database, count, size, oldest in rows}
+
+    def show_status(self):
+        status = self.status()
+        if status:
+            message = f"{self.name}: " + ", ".join(
+                f"{database} {count} batches, {size / (1024 * 1024):.1f} MB, oldest {age:.0f}s"
+                for database, (count, size, age) in status.items()
+            )
+        else:
+            message = f"{self.name} is empty"
+        if self.evicted:
+            message += f". {self.evicted} batches discarded over the size limit"
+        gr.Info(message)
+        return message
@@ -0,0 +1,503 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import gradio as gr
+from sqlalchemy import and_, bindparam, create_engine, Column, Text, LargeBinary, Integer, BigInteger, Float, String, DateTime, JSON, text, inspect, select, Table, MetaData, Index, cast, func, null
+from sqlalchemy import table as table_clause, column as column_clause
+from sqlalchemy.exc import DBAPIError
+import json
+import logging
+import threading
+from modules import shared
+from .blob_store import blob_store
+from .connection_pool import PooledConnection, pool_settings
+from .deduplication import deduplication_stats
+from .metrics import payload_size, stage_metrics
+from .prepared_record import database_codec, thumbnail_sizes, typed_metadata, typed_metadata_fields
+from .search import SearchResult, json_fragment, load_metadata, metadata_pattern
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SQLDatabase:
+
+    name = None
+    key = None
+    bytes_type = LargeBinary
+    blob_references = True
+    typed_columns = [
+        ('seed', BigInteger),
+        ('steps', Integer),
+        ('sampler', String(64)),
+        ('cfg_scale', Float),
+        ('width', Integer),
+        ('height', Integer),
+        ('model_hash', String(64)),
+        ('created_at', DateTime),
+    ]
+    components = None
+
+    def __init__(self, circuit_breaker):
+        self.tables = {}
+        self.side_tables = {}
+        self.tables_lock = threading.Lock()
+        self.pool = PooledConnection(self.name, self.create_engine, lambda engine: engine.dispose())
+        self.circuit_breaker = circuit_breaker
+
+    def option(self, name):
+        return getattr(shared.opts, f'nex_databases_{name}_{self.key}')
+
+    def engine_options(self):
+        pool_size, pre_ping, recycle = pool_settings()
+        return {
+            'pool_size': pool_size,
+            'pool_pre_ping': pre_ping,
+            'pool_recycle': recycle if recycle > 0 else -1,
+        }
+
+    def create_engine(self):
+        return create_engine(self.option('connection_string'), **self.engine_options())
+
+    def connection_settings(self):
+        return (self.option('connection_string'),) + pool_settings()
+
+    def instance(self):
+        return self.pool.get(self.connection_settings())
+
+    def warm_up(self):
+        with self.instance().connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    def test_connectivity(self):
+        message = ""
+        try:
+            with self.instance().connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.circuit_breaker.record_success()
+            message = f"Connected successfully to {self.name}!"
+            gr.Info(message)
+        except Exception as e:
+            message = f"Error connecting to {self.name}: {str(e)}"
+            gr.Warning(message)
+        finally:
+            return message
+
+    def enabled(self):
+        return self.option('enable')
+
+    def codec(self):
+        return database_codec(self.key)
+
+    def insert(self, batch):
+        if not self.enabled():
+            return
+
+        table_name = self.option('table')
+        columns = self.column_names()
+
+        engine = self.instance()
+
+        try:
+            table, table_columns = self.get_or_create_table(engine, table_name, columns)
+        except Exception as e:
+            logger.error(f"Error obtaining the table: {e}")
+            raise e
+
+        rows = [self.row(table, table_columns, record) for record in batch.records]
+
+        try:
+            try:
+                written = self.insert_rows(engine, table, rows, columns['hash'])
+            except DBAPIError:
+                if not self.recover_table(engine, table_name, columns):
+                    raise
+                table, table_columns = self.get_or_create_table(engine, table_name, columns)
+                rows = [self.row(table, table_columns, record) for record in batch.records]
+                written = self.insert_rows(engine, table, rows, columns['hash'])
+            deduplication_stats.record(self.name, len(rows), len(rows) - written)
+        except Exception as e:
+            logger.error(f"Error inserting data: {e}")
+            raise e
+
+    def search(self, query, cursor, limit):
+        columns = self.column_names()
+        table = self.browse_table(columns)
+        typed = self.typed(columns)
+        json_metadata = self.metadata_type(columns) is not Text
+        metadata = table.c[columns['metadata']]
+        metadata_text = cast(metadata, Text) if json_metadata else metadata
+
+        conditions = []
+        if cursor is not None:
+            conditions.append(table.c.id < cursor)
+        if query.prompt:
+            conditions.append(func.lower(metadata_text).contains(
+                json_fragment(query.prompt.lower(), ensure_ascii=not json_metadata), autoescape=True
+            ))
+        if query.seed:
+            if typed:
+                conditions.append(table.c[columns['seed']] == int(query.seed))
+            else:
+                conditions.append(metadata_text.contains(metadata_pattern('Seed', query.seed), autoescape=True))
+        if query.model_hash:
+            if typed:
+                conditions.append(table.c[columns['model_hash']] == query.model_hash)
+            else:
+                conditions.append(metadata_text.contains(metadata_pattern('Model hash', query.model_hash), autoescape=True))
+        if query.date_from or query.date_to:
+            if not typed:
+                raise ValueError(f"Filtering {self.name} by date needs typed metadata columns")
+            if query.date_from:
+                conditions.append(table.c[columns['created_at']] >= query.date_from)
+            if query.date_to:
+                conditions.append(table.c[columns['created_at']] < query.date_to)
+
+        with self.instance().connect() as conn:
+            available = set(column['name'] for column in inspect(conn).get_columns(self.option('table')))
+            created_at = table.c[columns['created_at']] if typed and columns['created_at'] in available else null()
+            thumbnail = null()
+            for size in self.thumbnail_sizes(columns):
+                if columns[f'thumbnail_{size}'] in available:
+                    thumbnail = table.c[columns[f'thumbnail_{size}']]
+                    break
+
+            rows = conn.execute(
+                select(table.c.id, table.c[columns['hash']], metadata, created_at, thumbnail)
+                .where(*conditions)
+                .order_by(table.c.id.desc())
+                .limit(limit + 1)
+            ).all()
+
+        results = [
+            SearchResult(row[0], row[1], load_metadata(row[2]), row[3], row[4])
+            for row in rows[:limit]
+        ]
+        next_cursor = results[-1].key if len(rows) > limit else None
+        return results, next_cursor
+
+    def read_image(self, key, chunk_size=1024 * 1024):
+        columns = self.column_names()
+        table = self.browse_table(columns)
+
+        with self.instance().connect() as conn:
+            if 'blob_key' in columns:
+                key_in_store = conn.execute(select(table.c[columns['blob_key']]).where(table.c.id == key)).scalar()
+                if key_in_store:
+                    yield from blob_store.read(key_in_store, chunk_size)
+                    return
+
+            yield from self.read_row_image(conn, table, columns, key, chunk_size)
+
+    def read_row_image(self, conn, table, columns, key, chunk_size):
+        yield from self.read_chunks(conn, table.c[columns['bytes']], table.c.id == key, chunk_size)
+
+    def read_chunks(self, conn, column, condition, chunk_size):
+        size = conn.execute(select(func.length(column)).where(condition)).scalar()
+        for offset in range(0, size or 0, chunk_size):
+            yield conn.execute(select(func.substr(column, offset + 1, chunk_size, type_=LargeBinary)).where(condition)).scalar()
+
+    def side_table(self, conn, name, *columns):
+        key = (self.option('connection_string'), name)
+        table = self.side_tables.get(key)
+        if table is None:
+            table = Table(name, MetaData(), *columns)
+            table.create(conn, checkfirst=True)
+            self.side_tables[key] = table
+        return table
+
+    def side_table_exists(self, conn, name):
+        return name in inspect(conn).get_table_names()
+
+    def browse_table(self, columns):
+        types = dict(self.typed_columns)
+        return table_clause(
+            self.option('table'),
+            column_clause('id'),
+            *[column_clause(name, types.get(role, LargeBinary if role.startswith('thumbnail_') else None)) for role, name in columns.items()]
+        )
+
+    def dispose(self):
+        self.pool.dispose()
+
+    def row(self, table, columns, record):
+        metadata_column = table.c[columns['metadata']]
+        row = {
+            columns['metadata']: record.metadata if isinstance(metadata_column.type, JSON) else record.metadata_json,
+            columns['bytes']: record.image_bytes,
+            columns['hash']: record.image_hash
+        }
+
+        for size in self.thumbnail_sizes(columns):
+            row[columns[f'thumbnail_{size}']] = record.thumbnails.get(size)
+
+        if 'blob_key' in columns:
+            row[columns['blob_key']] = record.blob_key
+            row[columns['blob_size']] = record.blob_size
+            if record.blob_key:
+                row[columns['bytes']] = None
+
+        if self.typed(columns):
+            for role, value in record.typed_metadata.items():
+                row[columns[role]] = value
+            row[columns['created_at']] = record.created_at
+
+        return row
+
+    def insert_rows(self, engine, table, rows, hash_column):
+        with stage_metrics.measure(self.name, "insert"), engine.begin() as conn:
+            seen = self.existing_hashes(conn, table, hash_column, [row[hash_column] for row in rows])
+            new_rows = []
+            for row in rows:
+                if row[hash_column] in seen:
+                    continue
+                seen.add(row[hash_column])
+                new_rows.append(row)
+
+            if new_rows:
+                self.write_rows(conn, table, new_rows)
+
+        stage_metrics.record_write(self.name, len(new_rows), sum(payload_size(row) for row in new_rows))
+        return len(new_rows)
+
+    def write_rows(self, conn, table, rows):
+        for chunk in self.statement_chunks(rows):
+            conn.execute(table.insert(), chunk)
+
+    def existing_hashes(self, conn, table, hash_column, hashes):
+        if not hashes:
+            return set()
+        column = table.c[hash_column]
+        return set(conn.execute(select(column).where(column.in_(set(hashes)))).scalars())
+
+    def statement_chunks(self, rows):
+        max_rows = int(self.option('max_rows'))
+        max_bytes = int(self.option('max_megabytes')) * 1024 * 1024
+
+        chunk = []
+        chunk_bytes = 0
+        for row in rows:
+            row_bytes = sum(len(value) for value in row.values() if isinstance(value, (bytes, str)))
+            if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > max_bytes):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(row)
+            chunk_bytes += row_bytes
+
+        if chunk:
+            yield chunk
+
+    def column_names(self):
+        columns = {
+            'metadata': self.option('metadata'),
+            'bytes': self.option('bytes'),
+            'hash': self.option('hash'),
+        }
+        columns.update({f'thumbnail_{size}': f'thumbnail_{size}' for size in thumbnail_sizes()})
+        if blob_store.enabled():
+            columns.update({'blob_key': 'blob_key', 'blob_size': 'blob_size'})
+        if self.option('typed_columns'):
+            columns.update({role: role for role, _ in self.typed_columns})
+        return columns
+
+    def typed(self, columns):
+        return 'created_at' in columns
+
+    def thumbnail_sizes(self, columns):
+        return sorted(int(role[len('thumbnail_'):]) for role in columns if role.startswith('thumbnail_'))
+
+    def metadata_type(self, columns):
+        return Text
+
+    def table_columns(self, columns):
+        table_columns = [
+            Column(columns['metadata'], self.metadata_type(columns)),
+            Column(columns['bytes'], self.bytes_type),
+            Column(columns['hash'], String(64), unique=True),
+        ]
+        table_columns += [Column(columns[f'thumbnail_{size}'], self.bytes_type) for size in self.thumbnail_sizes(columns)]
+        if 'blob_key' in columns:
+            table_columns += [Column(columns['blob_key'], String(255)), Column(columns['blob_size'], BigInteger)]
+        if self.typed(columns):
+            table_columns += [Column(columns[role], column_type, index=True) for role, column_type in self.typed_columns]
+        return table_columns
+
+    def table_indexes(self, table, columns):
+        return []
+
+    def table_key(self, tbl_name, columns):
+        return (self.option('connection_string'), tbl_name) + tuple(sorted(columns.items()))
+
+    def get_or_create_table(self, engine, tbl_name, columns):
+        key = self.table_key(tbl_name, columns)
+        with self.tables_lock:
+            entry = self.tables.get(key)
+            if entry is None:
+                with stage_metrics.measure(self.name, "schema"):
+                    insp = inspect(engine)
+                    if tbl_name not in insp.get_table_names():
+                        table = self.create_table(engine, tbl_name, columns)
+                    else:
+                        table = self.load_table(engine, tbl_name, columns)
+                entry = (table, self.writable_columns(table, columns))
+                self.tables = {key: entry}
+            return entry
+
+    def writable_columns(self, table, columns):
+        required = ('metadata', 'bytes', 'hash')
+        writable = {role: name for role, name in columns.items() if role in required or name in table.c}
+        typed_roles = [role for role, _ in self.typed_columns]
+        if not all(role in writable for role in typed_roles):
+            writable = {role: name for role, name in writable.items() if role not in typed_roles}
+        return writable
+
+    def recover_table(self, engine, tbl_name, columns):
+        with self.tables_lock:
+            self.tables.pop(self.table_key(tbl_name, columns), None)
+        if tbl_name in inspect(engine).get_table_names():
+            return False
+        logger.warning(f"Table {tbl_name} disappeared from {self.name}, recreating it")
+        return True
+
+    def create_table(self, engine, tbl_name, columns):
+        table = Table(
+            tbl_name,
+            MetaData(),
+            Column('id', Integer, primary_key=True, index=True, autoincrement=True),
+            *self.table_columns(columns)
+        )
+        self.table_indexes(table, columns)
+
+        table.metadata.create_all(bind=engine)
+        return table
+
+    def load_table(self, engine, tbl_name, columns):
+        table = Table(tbl_name, MetaData(), autoload_with=engine)
+        if columns['hash'] not in table.c:
+            self.add_columns(engine, table, [column for column in self.table_columns(columns) if column.name == columns['hash']])
+            table = Table(tbl_name, MetaData(), autoload_with=engine)
+
+        pending = self.pending_migrations(table, columns)
+        if pending:
+            logger.warning(
+                f"{tbl_name} in {self.name} is not migrated ({', '.join(pending)}). "
+                f"New rows are written without the missing columns until Migrate Existing Table - {self.name}! is run"
+            )
+        return table
+
+    def pending_migrations(self, table, columns):
+        pending = [f"column {column.name}" for column in self.table_columns(columns) if column.name not in table.c]
+        metadata_type = self.metadata_type(columns)
+        if self.typed(columns) and not isinstance(table.c[columns['metadata']].type, metadata_type):
+            pending.append(f"{columns['metadata']} converted to {metadata_type.__name__}")
+        return pending
+
+    def migrate_table(self):
+        message = ""
+        try:
+            message = self.migrate()
+            gr.Info(message)
+        except Exception as e:
+            message = f"Error migrating {self.option('table')} in {self.name}: {str(e)}"
+            gr.Warning(message)
+        finally:
+            return message
+
+    def migrate(self):
+        table_name = self.option('table')
+        columns = self.column_names()
+        engine = self.instance()
+        if table_name not in inspect(engine).get_table_names():
+            return f"{table_name} does not exist in {self.name} yet, the first write creates it with every column"
+
+        table = Table(table_name, MetaData(), autoload_with=engine)
+        missing = [column for column in self.table_columns(columns) if column.name not in table.c]
+        if missing:
+            self.add_columns(engine, table, missing)
+        filled = 0
+        if self.typed(columns):
+            self.migrate_metadata_column(engine, table, columns)
+            table = Table(table_name, MetaData(), autoload_with=engine)
+            filled = self.backfill_typed_columns(engine, table, columns)
+
+        with self.tables_lock:
+            self.tables = {}
+        return f"Migrated {table_name} in {self.name}: {len(missing)} columns added, typed columns filled in {filled} rows"
+
+    def migrate_metadata_column(self, engine, table, columns):
+        pass
+
+    def backfill_typed_columns(self, engine, table, columns):
+        if 'id' not in table.c:
+            return 0
+
+        logger.info(f"Filling typed metadata columns of existing rows in {table.name} in {self.name}")
+        metadata_column = table.c[columns['metadata']]
+        roles = list(typed_metadata_fields)
+        unfilled = and_(*[table.c[columns[role]].is_(None) for role in roles])
+        update = table.update().where(table.c.id == bindparam('row_id')).values(
+            **{columns[role]: bindparam(f'typed_{role}') for role in roles}
+        )
+        filled = 0
+        last_id = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(table.c.id, metadata_column).where(table.c.id > last_id, unfilled).order_by(table.c.id).limit(1000)
+                ).all()
+                if not rows:
+                    return filled
+
+                updates = []
+                for row_id, metadata in rows:
+                    try:
+                        values = typed_metadata(json.loads(metadata) if isinstance(metadata, str) else metadata or {})
+                    except ValueError:
+                        continue
+                    if any(value is not None for value in values.values()):
+                        updates.append({'row_id': row_id, **{f'typed_{role}': value for role, value in values.items()}})
+                if updates:
+                    conn.execute(update, updates)
+                filled += len(updates)
+                last_id = rows[-1][0]
+
+    def add_columns(self, engine, table, columns):
+        dialect = engine.dialect
+        preparer = dialect.identifier_preparer
+        with engine.begin() as conn:
+            for column in columns:
+                logger.info(f"Adding column {column.name} to {table.name} in {self.name}")
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+                ))
+
+        reflected = Table(table.name, MetaData(), autoload_with=engine)
+        with engine.begin() as conn:
+            for column in columns:
+                if column.unique or column.index:
+                    Index(f"ix_{table.name}_{column.name}", reflected.c[column.name], unique=bool(column.unique)).create(conn)
@@ -24,142 +24,131 @@ SOFTWARE.
 
 """
 
-import gradio as gr
-from io import BytesIO
-import json
-from sqlalchemy import create_engine, Column, Text, LargeBinary, Integer, inspect, Table, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, LargeBinary, String, create_engine, event, func, select
+from sqlalchemy import table as table_clause, column as column_clause
 import logging
-from modules import generation_parameters_copypaste
-from modules import shared
-from .setting_button import OptionButton
+import threading
+import time
+from .sql_database import SQLDatabase
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-Base = declarative_base()
 
-
-class SQLiteDatabase:
+class SQLiteDatabase(SQLDatabase):
 
     name = "SQLite"
-    connection = None
-    session_instance = None
-    components = None
-
-    def __init__(self):
-
-        shared.options_templates.update(
-            shared.options_section(
-                ('nex-databases', "Nex databases"), {
-                    f'nex_databases_enable_sqlite': shared.OptionInfo(False, 'Enable - SQLite'),
-                    f'nex_databases_connection_string_sqlite': shared.OptionInfo(
-                        "", 'Connection String - SQLite', gr.Textbox,
-                        {'placeholder': 'sqlite:///your_database_file.db'}
-                    ),
-                    f'nex_databases_table_sqlite': shared.OptionInfo("", 'Table Name - SQLite'),
-                    f'nex_databases_metadata_sqlite': shared.OptionInfo("", 'Image Metadata Column Name - SQLite'),
-                    f'nex_databases_bytes_sqlite': shared.OptionInfo("", 'Image Bytes Column Name - SQLite'),
-                    f'nex_databases_test_button_sqlite': OptionButton('Test - SQLite!', self.test_connectivity),
-                }
-            )
+    key = "sqlite"
+    bytes_type = LargeBinary
+
+    def __init__(self, circuit_breaker):
+        super().__init__(circuit_breaker)
+        self.last_maintenance = time.monotonic()
+        self.maintenance_lock = threading.Lock()
+
+    def tuned(self):
+        return self.option('tuned')
+
+    def engine_options(self):
+        options = super().engine_options()
+        options.pop('pool_size')
+        return options
+
+    def pragmas(self):
+        return [
+            f"PRAGMA page_size = {int(self.option('page_size'))}",
+            "PRAGMA auto_vacuum = INCREMENTAL",
+            "PRAGMA journal_mode = WAL",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA cache_size = {-1024 * int(self.option('cache_megabytes'))}",
+            f"PRAGMA mmap_size = {1024 * 1024 * int(self.option('mmap_megabytes'))}",
+        ]
+
+    def create_engine(self):
+        engine = create_engine(self.option('connection_string'), **self.engine_options())
+        if self.tuned():
+            pragmas = self.pragmas()
+
+            @event.listens_for(engine, "connect")
+            def set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                try:
+                    for pragma in pragmas:
+                        cursor.execute(pragma)
+                finally:
+                    cursor.close()
+
+        return engine
+
+    def connection_settings(self):
+        settings = super().connection_settings()
+        if self.tuned():
+            settings += tuple(self.pragmas())
+        return settings
+
+    def insert(self, batch):
+        super().insert(batch)
+        if self.enabled() and self.tuned():
+            self.maintain()
+
+    def write_rows(self, conn, table, rows):
+        if not self.tuned():
+            return super().write_rows(conn, table, rows)
+
+        columns = self.column_names()
+        images = self.image_table(conn, table)
+        image_rows = [
+            {'image_hash': row[columns['hash']], 'image': row[columns['bytes']]}
+            for row in rows if row[columns['bytes']] is not None
+        ]
+        for chunk in self.statement_chunks(image_rows):
+            conn.execute(images.insert().prefix_with("OR IGNORE"), chunk)
+
+        super().write_rows(conn, table, [{**row, columns['bytes']: None} for row in rows])
+
+    def image_table_name(self, table_name):
+        return f"{table_name}_images"
+
+    def image_table(self, conn, table):
+        return self.side_table(
+            conn,
+            self.image_table_name(table.name),
+            Column('image_hash', String(64), primary_key=True),
+            Column('image', LargeBinary),
         )
 
-    def instance(self):
-        self.connection = create_engine(shared.opts.nex_databases_connection_string_sqlite)
-        Session = sessionmaker(bind=self.connection)
-        self.session_instance = Session()
-
-    def test_connectivity(self):
-        message = ""
-        try:
-            self.instance()
-            with self.connection.connect() as conn:
-                conn.execute(text("SELECT 1"))
-            message = f"Connected successfully to {self.name}!"
-            gr.Info(message)
-        except Exception as e:
-            message = f"Error connecting to {self.name}: {str(e)}"
-            gr.Warning(message)
-        finally:
-            self.close()
-            return message
-
-    def insert(self, processed):
-        if not shared.opts.nex_databases_enable_sqlite:
+    def read_row_image(self, conn, table, columns, key, chunk_size):
+        inline = conn.execute(select(func.length(table.c[columns['bytes']])).where(table.c.id == key)).scalar()
+        image_table_name = self.image_table_name(table.name)
+        if inline or not self.side_table_exists(conn, image_table_name):
+            yield from super().read_row_image(conn, table, columns, key, chunk_size)
             return
 
-        table_name = shared.opts.nex_databases_table_sqlite
-        image_metadata_column = shared.opts.nex_databases_metadata_sqlite
-        image_bytes_column = shared.opts.nex_databases_bytes_sqlite
+        images = table_clause(image_table_name, column_clause('image_hash'), column_clause('image', LargeBinary))
+        image_hash = select(table.c[columns['hash']]).where(table.c.id == key).scalar_subquery()
+        yield from self.read_chunks(conn, images.c.image, images.c.image_hash == image_hash, chunk_size)
 
-        self.instance()
+    def maintain(self):
+        with self.maintenance_lock:
+            if time.monotonic() - self.last_maintenance < int(self.option('maintenance_interval')):
+                return
+            self.last_maintenance = time.monotonic()
 
         try:
-            table = self.get_or_create_table(table_name, image_metadata_column, image_bytes_column)
+            with self.instance().connect() as conn:
+                cursor = conn.connection.cursor()
+                try:
+                    busy = cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+                    auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+                    free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                    if auto_vacuum == 2 and free_pages:
+                        cursor.execute("PRAGMA incremental_vacuum").fetchall()
+                finally:
+                    cursor.close()
+            logger.info(
+                ("Checkpoint blocked by readers" if busy else "Checkpointed and truncated the WAL")
+                + (f", released {free_pages} free pages" if auto_vacuum == 2 and free_pages else "")
+                + f" in {self.name}"
+            )
         except Exception as e:
-            logger.error(f"Error obtaining the table: {e}")
-            raise e
-        
-        for i in range(len(processed.images)):
-
-            metadata = json.dumps(generation_parameters_copypaste.parse_generation_parameters(processed.infotexts[i]))
-
-            image = processed.images[i]
-            buffer = BytesIO()
-            image.save(buffer, "png")
-            image_bytes = buffer.getvalue()
-
-            data = {
-                image_metadata_column: metadata,
-                image_bytes_column: image_bytes
-            }
-
-            try:
-                self.insert_data(table, **data)
-                self.session_instance.commit()
-            except Exception as e:
-                self.session_instance.rollback()
-                logger.error(f"Error inserting data: {e}")
-                raise e
-            finally:
-                self.session_instance.close()
-
-    def close(self):
-        if self.connection:
-            self.connection.dispose()
-            self.connection = None
-
-    def insert_data(self, table, **data):
-        if isinstance(table, Table):
-            stmt = table.insert().values(**data)
-            self.session_instance.execute(stmt)
-        else:
-            new_row = table(**data)
-            self.session_instance.add(new_row)
-        self.session_instance.commit()
-
-    def get_or_create_table(self, tbl_name, column1_name, column2_name):
-        insp = inspect(self.connection)
-        if tbl_name not in insp.get_table_names():
-            return self.create_table_and_orm_class(tbl_name, column1_name, column2_name)
-        return self.load_table(tbl_name)
-
-    def create_table_and_orm_class(self, tbl_name, column1_name, column2_name):
-        class_table = type(
-            tbl_name,
-            (Base,),
-            {
-                '__tablename__': tbl_name,
-                'id': Column(Integer, primary_key=True, index=True, autoincrement=True),
-                column1_name: Column(Text),
-                column2_name: Column(LargeBinary)
-            }
-        )
-
-        Base.metadata.create_all(bind=self.connection)
-        return class_table
-
-    def load_table(self, tbl_name):
-        return Table(tbl_name, Base.metadata, autoload_with=self.connection)
+            logger.warning(f"Error maintaining {self.name}: {e}")
@@ -0,0 +1,275 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+
+import atexit
+import gradio as gr
+import logging
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from modules import shared
+from .blob_store import blob_references, blob_store
+from .deduplication import deduplication_stats
+from .metrics import stage_metrics
+from .setting_button import OptionButton
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+
+    name = "Write Queue"
+    flush_timeout = 60
+
+    def __init__(self, databases, preparer, fan_out, spool):
+        self.databases = databases
+        self.preparer = preparer
+        self.fan_out = fan_out
+        self.spool = spool
+        self.queue = None
+        self.workers = []
+        self.lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        shared.options_templates.update(
+            shared.options_section(
+                ('nex-databases', "Nex databases"), {
+                    f'nex_databases_enable_write_queue': shared.OptionInfo(True, 'Enable - Background Write Queue'),
+                    f'nex_databases_size_write_queue': shared.OptionInfo(
+                        16, 'Max Queued Batches - Write Queue (applies after a restart)', gr.Slider,
+                        {'minimum': 1, 'maximum': 256, 'step': 1}
+                    ),
+                    f'nex_databases_workers_write_queue': shared.OptionInfo(
+                        1, 'Worker Threads - Write Queue', gr.Slider,
+                        {'minimum': 1, 'maximum': 8, 'step': 1}
+                    ),
+                    f'nex_databases_when_full_write_queue': shared.OptionInfo(
+                        "block", 'When Full - Write Queue (spill encodes the batch on the generation thread and puts it in the spool)', gr.Radio,
+                        {'choices': ["block", "drop", "spill"]}
+                    ),
+                    f'nex_databases_streaming_write_queue': shared.OptionInfo(
+                        False, 'Write Images As Each Batch Is Generated - Write Queue'
+                    ),
+                    f'nex_databases_status_button_write_queue': OptionButton('Status - Write Queue!', self.show_status),
+                }
+            )
+        )
+
+        atexit.register(self.shutdown)
+
+    def streaming(self):
+        return shared.opts.nex_databases_streaming_write_queue
+
+    def put(self, processed):
+        self.put_images(processed.images, processed.infotexts, processed.prompt)
+
+    def put_images(self, images, infotexts, prompt):
+        batch = SimpleNamespace(
+            images=list(images),
+            infotexts=list(infotexts),
+            prompt=prompt,
+        )
+
+        if not shared.opts.nex_databases_enable_write_queue:
+            self.write(batch)
+            return
+
+        self.start()
+        job = (time.monotonic(), batch)
+        when_full = shared.opts.nex_databases_when_full_write_queue
+
+        if when_full == "block":
+            self.queue.put(job)
+            return
+
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            if when_full == "drop":
+                with self.lock:
+                    self.dropped += 1
+                logger.warning(f"{self.name} is full, dropping a batch of {len(batch.images)} images")
+            else:
+                with self.lock:
+                    self.spilled += 1
+                self.spill(batch)
+
+    def start(self):
+        with self.lock:
+            if self.queue is None:
+                self.queue = queue.Queue(maxsize=int(shared.opts.nex_databases_size_write_queue))
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            while len(self.workers) < int(shared.opts.nex_databases_workers_write_queue):
+                worker = threading.Thread(target=self.work, name=f"nex-databases-writer-{len(self.workers)}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                enqueued_at, batch = job
+                self.record_lag(time.monotonic() - enqueued_at)
+                self.write(batch)
+            except Exception as e:
+                logger.error(f"Error writing a queued batch: {e}")
+            finally:
+                self.queue.task_done()
+
+    def prepare(self, batch):
+        codecs = {database: database.codec() for database in self.databases if database.enabled()}
+        if not codecs:
+            return {}
+        prepared = self.preparer.prepare(batch, set(codecs.values()))
+        return {database: prepared[codec] for database, codec in codecs.items()}
+
+    def write(self, batch):
+        try:
+            batches = self.prepare(batch)
+        except Exception as e:
+            print(f"Error after post processing: {str(e)}")
+            return False
+        if not batches:
+            return True
+
+        if blob_store.enabled():
+            self.store_blobs(batches)
+
+        lost = 0
+        for database in self.fan_out.write(batches):
+            try:
+                if not self.spool.append(database, batches[database]):
+                    lost += 1
+            except Exception as e:
+                lost += 1
+                logger.error(f"Error spooling a batch for {database.name}: {e}")
+
+        with self.lock:
+            self.written += 1
+        return not lost
+
+    def spill(self, batch):
+        if not self.spool.enabled():
+            self.write(batch)
+            return
+
+        try:
+            batches = self.prepare(batch)
+        except Exception as e:
+            print(f"Error after post processing: {str(e)}")
+            return
+
+        for database, prepared in batches.items():
+            try:
+                self.spool.append(database, prepared)
+            except Exception as e:
+                logger.error(f"Error spooling a batch for {database.name}: {e}")
+
+    def store_blobs(self, batches):
+        records = [record for database, batch in batches.items() if blob_references(database) for record in batch.records]
+        if not records:
+            return
+
+        try:
+            with stage_metrics.measure(blob_store.name, "insert"):
+                blob_store.put_records(records)
+        except Exception as e:
+            logger.error(f"Error writing images to the {blob_store.name}, storing them in the databases instead: {e}")
+
+    def record_lag(self, lag):
+        with self.lock:
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue is not None and self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self):
+        with self.lock:
+            workers = self.workers
+            self.workers = []
+
+        if workers:
+            if not self.flush(self.flush_timeout):
+                logger.warning(f"{self.name} did not drain within {self.flush_timeout}s, {self.queue.qsize()} batches left")
+
+            for _ in workers:
+                try:
+                    self.queue.put(None, timeout=5)
+                except queue.Full:
+                    logger.warning(f"{self.name} workers are still busy, leaving them to stop with the webui")
+                    break
+            for worker in workers:
+                worker.join(timeout=5)
+
+        self.spool.shutdown()
+        self.fan_out.shutdown()
+        self.preparer.shutdown()
+        blob_store.shutdown()
+        for database in self.databases:
+            database.dispose()
+
+    def status(self):
+        with self.lock:
+            return {
+                "depth": self.queue.qsize() if self.queue else 0,
+                "capacity": self.queue.maxsize if self.queue else int(shared.opts.nex_databases_size_write_queue),
+                "workers": len(self.workers),
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+                "written": self.written,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+            }
+
+    def show_status(self):
+        status = self.status()
+        message = (
+            f"{self.name}: {status['depth']}/{status['capacity']} batches queued, "
+            f"lag {status['last_lag']:.2f}s (max {status['max_lag']:.2f}s), "
+            f"{status['written']} written, {status['dropped']} dropped, {status['spilled']} spilled"
+        )
+        deduplication = deduplication_stats.summary()
+        if deduplication:
+            message += f". Deduplication: {deduplication}"
+        outcomes = self.fan_out.last_outcomes()
+        if outcomes:
+            message += ". Last writes: " + ", ".join(f"{name} {outcome}" for name, outcome in outcomes.items())
+        gr.Info(message)
+        return message
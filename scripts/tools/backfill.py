@@ -0,0 +1,297 @@
+"""
+MIT License
+
+Copyright (c) [2023] Nicholas Ooi
+https://github.com/nicholas-ooi
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import hashlib
+from io import BytesIO
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from types import SimpleNamespace
+from PIL import Image, UnidentifiedImageError
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+extension_dir = os.path.dirname(os.path.dirname(tools_dir))
+webui_root = os.path.dirname(os.path.dirname(extension_dir))
+default_config_path = os.path.join(webui_root, "config.json")
+default_checkpoint_path = os.path.join(extension_dir, "backfill", "checkpoint.db")
+image_extensions = (".png",)
+
+
+def read_image(path):
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+
+        image = Image.open(BytesIO(data))
+        image.load()
+        infotext = image.info.get("parameters")
+        if not infotext:
+            return path, file_hash, None, None, None
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        return path, file_hash, infotext, image, None
+    except UnidentifiedImageError:
+        return path, None, None, None, "not an image"
+    except Exception as e:
+        return path, None, None, None, str(e)
+
+
+def read_images(paths, workers):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(read_image, path))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Checkpoint:
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, file_hash TEXT, status TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_files_file_hash ON files (file_hash)")
+
+    def done(self):
+        return {path: (size, mtime) for path, size, mtime in self.connection.execute("SELECT path, size, mtime FROM files")}
+
+    def imported_hashes(self):
+        return set(row[0] for row in self.connection.execute("SELECT file_hash FROM files WHERE status = 'imported'"))
+
+    def record(self, entries):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime, file_hash, status) VALUES (?, ?, ?, ?, ?)",
+                entries
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def list_images(directories, done):
+    paths = []
+    skipped = 0
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(image_extensions):
+                    continue
+                path = os.path.abspath(os.path.join(root, name))
+                stat = os.stat(path)
+                if done.get(path) == (stat.st_size, stat.st_mtime):
+                    skipped += 1
+                    continue
+                paths.append((path, stat.st_size, stat.st_mtime))
+    return paths, skipped
+
+
+def load_options(args):
+    options = {}
+    if os.path.exists(args.config):
+        with open(args.config, encoding="utf-8") as file:
+            options.update(json.load(file))
+    elif args.config != default_config_path:
+        raise SystemExit(f"webui settings file {args.config} does not exist")
+    for option in args.option:
+        name, _, value = option.partition("=")
+        options[name] = value
+    return options
+
+
+def load_webui_parser():
+    sys.path.insert(0, webui_root)
+    argv = sys.argv
+    sys.argv = argv[:1]
+    try:
+        from modules import shared
+        if getattr(shared, "opts", None) is None:
+            from modules import shared_init
+            shared_init.initialize()
+        from modules import generation_parameters_copypaste
+    except Exception as e:
+        raise SystemExit(
+            f"Cannot import the webui infotext parser from {webui_root} ({e}). "
+            "Run the tool with the webui's Python from the webui folder, or pass --stub-parser."
+        )
+    finally:
+        sys.argv = argv
+        sys.path.remove(webui_root)
+    return generation_parameters_copypaste.parse_generation_parameters
+
+
+class Progress:
+
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.without_parameters = 0
+        self.failed = 0
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.imported / elapsed
+        remaining = (self.total - self.read) / (self.read / elapsed) if self.read else 0
+        return (
+            f"{self.read}/{self.total} files read, {self.imported} imported ({rate:.1f} images/s), "
+            f"{self.duplicates} duplicates, {self.without_parameters} without parameters, {self.failed} failed, "
+            f"{elapsed:.0f}s elapsed, about {remaining:.0f}s left"
+        )
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if force or now - self.reported >= self.interval:
+            self.reported = now
+            print(self.line(), flush=True)
+
+
+def backfill(args):
+    checkpoint = Checkpoint(args.checkpoint)
+    paths, unchanged = list_images(args.directories, checkpoint.done())
+    print(f"{len(paths)} images to read, {unchanged} already in the checkpoint", flush=True)
+    if not paths:
+        return
+
+    parser = None if args.stub_parser else load_webui_parser()
+    for name in [name for name in sys.modules if name == "modules" or name.startswith("modules.")]:
+        sys.modules.pop(name)
+
+    sys.path.insert(0, os.path.join(os.path.dirname(tools_dir), "benchmark"))
+    sys.path.insert(1, os.path.dirname(tools_dir))
+    import webui_stubs
+    webui_stubs.install(load_options(args), parser)
+
+    from modules import generation_parameters_copypaste
+    import nex_databases
+
+    enabled = [database.name for database in nex_databases.databases if database.enabled()]
+    if not enabled:
+        raise SystemExit("No database is enabled, enable one in the webui settings or with --option nex_databases_enable_<key>=true")
+    if args.migrate:
+        for database in nex_databases.databases:
+            if database.enabled() and hasattr(database, "migrate"):
+                try:
+                    print(database.migrate(), flush=True)
+                except Exception as e:
+                    nex_databases.writer.shutdown()
+                    raise SystemExit(f"Error migrating {database.name}: {e}")
+    print(f"Importing into {', '.join(enabled)} with {args.workers} reader processes", flush=True)
+
+    stats = dict((path, (size, mtime)) for path, size, mtime in paths)
+    imported_hashes = checkpoint.imported_hashes()
+    progress = Progress(len(paths), args.progress_interval)
+    batch = SimpleNamespace(images=[], infotexts=[], prompt=None, prompts=[], created_at=[], entries=[])
+
+    def flush():
+        if not batch.images:
+            return
+        if nex_databases.writer.write(batch):
+            checkpoint.record(batch.entries)
+            imported_hashes.update(entry[3] for entry in batch.entries)
+            progress.imported += len(batch.entries)
+        else:
+            progress.failed += len(batch.entries)
+            print(f"Failed to write {len(batch.entries)} images, they are retried on the next run", flush=True)
+        batch.images, batch.infotexts, batch.prompts, batch.created_at, batch.entries = [], [], [], [], []
+
+    try:
+        for path, file_hash, infotext, image, error in read_images([path for path, _, _ in paths], args.workers):
+            progress.read += 1
+            size, mtime = stats[path]
+
+            if error:
+                progress.failed += 1
+                checkpoint.record([(path, size, mtime, file_hash, "unreadable")])
+                print(f"Error reading {path}: {error}", flush=True)
+            elif file_hash in imported_hashes:
+                progress.duplicates += 1
+                checkpoint.record([(path, size, mtime, file_hash, "duplicate")])
+            elif any(entry[3] == file_hash for entry in batch.entries):
+                progress.duplicates += 1
+            elif not infotext:
+                progress.without_parameters += 1
+                checkpoint.record([(path, size, mtime, file_hash, "no parameters")])
+            else:
+                if len(batch.images) >= args.batch_size:
+                    flush()
+                batch.images.append(image)
+                batch.prompts.append(generation_parameters_copypaste.parse_generation_parameters(infotext).get("Prompt", ""))
+                batch.infotexts.append(infotext)
+                batch.created_at.append(datetime.fromtimestamp(mtime, timezone.utc).replace(tzinfo=None))
+                batch.entries.append((path, size, mtime, file_hash, "imported"))
+
+            progress.report()
+        flush()
+    finally:
+        progress.report(force=True)
+        nex_databases.writer.shutdown()
+        checkpoint.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import existing webui PNG outputs into the enabled Nex databases.")
+    parser.add_argument("directories", nargs="+", help="directories searched recursively for PNG files, e.g. outputs/txt2img-images")
+    parser.add_argument("--config", default=default_config_path, help="webui settings file with the Nex databases settings")
+    parser.add_argument("--option", action="append", default=[], help="setting as name=value, overriding the settings file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes reading and decoding images")
+    parser.add_argument("--batch-size", type=int, default=16, help="most images written per batch")
+    parser.add_argument("--stub-parser", action="store_true", help="parse infotexts with the bundled copy of the webui parser instead of importing the webui's own")
+    parser.add_argument("--migrate", action="store_true", help="add missing columns and convert the metadata column of existing SQL tables before importing")
+    parser.add_argument("--checkpoint", default=default_checkpoint_path, help="file recording imported files, to resume and skip them")
+    parser.add_argument("--progress-interval", type=float, default=5, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    missing = [directory for directory in args.directories if not os.path.isdir(directory)]
+    if missing:
+        parser.error(f"not a directory: {', '.join(missing)}")
+
+    backfill(args)
+
+
+if __name__ == "__main__":
+    main()